@@ -0,0 +1,22 @@
+from tool_loader import load_tool
+
+# 识别后端：按名字加载识别脚本，或在当前进程里加载模型得到一个识别函数。
+# 常驻服务（asr_server.py）和需要顺带识别的合并、转换工具都从这里加载，工具不必导入 HTTP 服务。
+
+BACKEND_SCRIPTS = {
+    "whisper": "whisper-based-audio2txt.py",
+    "funasr": "funasr-based-audio2txt-richman.py",
+}
+
+def load_script(name):
+    return load_tool(BACKEND_SCRIPTS[name], f"asr_backend_{name}")
+
+def load_recognizer(name):
+    # 在当前进程加载后端，返回 recognize(audio, sample_rate=None) -> 文本（失败为 None）
+    # audio 可以是文件路径，也可以是 AudioSegment / numpy 数组等内存音频，合并、转换工具用它直接识别 PCM
+    script = load_script(name)
+    if name == "whisper":
+        processor, model = script.init_model()
+        return lambda audio, sample_rate=None: script.recognize_audio(processor, model, audio, sample_rate)
+    model = script.init_model()
+    return lambda audio, sample_rate=None: script.recognize_audio(model, audio, sample_rate)
@@ -0,0 +1,203 @@
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from asr_backends import BACKEND_SCRIPTS, load_script
+
+# 常驻本地识别服务：启动时加载一次模型并一直保持，识别脚本设置 SERVER_URL 后只把文件路径发过来，
+# 不用每次运行都等几十秒加载模型。多个客户端的请求进入同一个队列，凑成批次一起识别，结果逐行流式返回。
+# 用 localhost HTTP 而不是 Unix socket，Windows 上也能用。
+#
+#   python asr_server.py --backend funasr --backend whisper
+#
+# 协议：POST /transcribe  {"backend": "whisper", "paths": [文件或目录, ...]}
+#       返回 JSON Lines，每行 {"path": ..., "text": ...}（失败时 text 为 null），最后一行 {"done": true}
+#       GET /health 返回已加载的后端
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+SUPPORTED_FORMATS = {".wav", ".mp3", ".flac", ".m4a", ".ogg"}
+
+MAX_BATCH_FILES = 64  # 每次交给模型的最多文件数（跨客户端合并）
+BATCH_WAIT = 0.05     # 拿到第一个文件后再等多久收集其他客户端的文件（秒）
+
+# ---------- 客户端 ----------
+def transcribe_remote(server_url, backend, paths, emit):
+    # 瘦客户端：把文件交给常驻服务识别，每收到一条结果调用 emit(path, text)，返回收到的结果数
+    body = json.dumps({"backend": backend, "paths": paths}, ensure_ascii=False).encode("utf-8")
+    request = urllib.request.Request(
+        server_url.rstrip("/") + "/transcribe", data=body, headers={"Content-Type": "application/json"}
+    )
+    print(f"交给识别服务 {server_url}（{backend}）识别 {len(paths)} 个文件")
+    count = 0
+    with urllib.request.urlopen(request) as response:
+        for line in response:
+            record = json.loads(line)
+            if record.get("done"):
+                break
+            emit(record["path"], record["text"])
+            count += 1
+    return count
+
+# ---------- 服务端 ----------
+def expand_paths(paths):
+    # 目录展开为其中的音频文件（按文件名排序），文件原样保留
+    files = []
+    for path in paths:
+        path = os.path.abspath(path)
+        if os.path.isdir(path):
+            files.extend(sorted(
+                os.path.join(path, f) for f in os.listdir(path)
+                if os.path.splitext(f)[1].lower() in SUPPORTED_FORMATS
+            ))
+        else:
+            files.append(path)
+    return files
+
+class Job:
+    def __init__(self, paths):
+        self.paths = paths
+        self.results = queue.Queue()
+        self.cancelled = False
+
+class Backend:
+    # 一个后端一个推理线程，模型只在这个线程里使用
+    def __init__(self, name):
+        self.name = name
+        self.script = load_script(name)
+        start = time.perf_counter()
+        self.model = self.script.init_model()
+        print(f"[{name}] 模型加载用时 {time.perf_counter() - start:.1f} 秒")
+        self.queue = queue.Queue()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, job):
+        for path in job.paths:
+            self.queue.put((path, job))
+
+    def _next_batch(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + BATCH_WAIT
+        while len(batch) < MAX_BATCH_FILES:
+            try:
+                batch.append(self.queue.get(timeout=max(0.0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        return [(path, job) for path, job in batch if not job.cancelled]
+
+    def _transcribe(self, paths, emit):
+        # 复用脚本里的批量识别；路径是绝对路径，os.path.join(AUDIO_DIR, path) 会得到路径本身
+        if self.name == "whisper":
+            processor, model = self.model
+            self.script.transcribe_pending(
+                processor, model, [(path, None) for path in paths], lambda path, _, text: emit(path, text)
+            )
+        else:
+            self.script.transcribe_pending(self.model, paths, emit)
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                continue
+            # 不同客户端提交的同一文件只识别一次
+            waiting = {}
+            for path, job in batch:
+                if os.path.isfile(path):
+                    waiting.setdefault(path, []).append(job)
+                else:
+                    job.results.put({"path": path, "text": None, "error": "文件不存在"})
+
+            def emit(path, text):
+                for job in waiting.pop(path, []):
+                    job.results.put({"path": path, "text": text})
+
+            start = time.perf_counter()
+            try:
+                if waiting:
+                    self._transcribe(list(waiting), emit)
+            except Exception as e:
+                print(f"[{self.name}] 批量识别出错: {e}")
+            # 没有结果的文件也要回复，客户端才不会一直等
+            for path in list(waiting):
+                emit(path, None)
+            print(f"[{self.name}] 识别 {len(batch)} 个文件用时 {time.perf_counter() - start:.1f} 秒，队列剩余 {self.queue.qsize()}")
+
+class RequestHandler(BaseHTTPRequestHandler):
+    backends = {}
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {"backends": sorted(self.backends)})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/transcribe":
+            self._send_json(404, {"error": "not found"})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            backend = self.backends[request["backend"]]
+            paths = expand_paths(request["paths"])
+        except KeyError as e:
+            self._send_json(400, {"error": f"缺少参数或后端未加载: {e}"})
+            return
+        except ValueError as e:
+            self._send_json(400, {"error": f"请求格式错误: {e}"})
+            return
+
+        job = Job(paths)
+        backend.submit(job)
+        # HTTP/1.0 不带 Content-Length，逐行写出，写完关闭连接
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson; charset=utf-8")
+        self.end_headers()
+        try:
+            for _ in paths:
+                record = job.results.get()
+                self.wfile.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+                self.wfile.flush()
+            self.wfile.write(b'{"done": true}\n')
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端中途断开，队列里还没开始识别的文件不再处理
+            job.cancelled = True
+
+    def log_message(self, format, *args):
+        pass
+
+def main():
+    parser = argparse.ArgumentParser(description="常驻本地识别服务")
+    parser.add_argument("--backend", action="append", choices=sorted(BACKEND_SCRIPTS),
+                        help="要加载的后端，可重复指定（默认 whisper）")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+
+    for name in args.backend or ["whisper"]:
+        RequestHandler.backends[name] = Backend(name)
+    server = ThreadingHTTPServer((args.host, args.port), RequestHandler)
+    print(f"识别服务已启动: http://{args.host}:{args.port}（后端: {', '.join(sorted(RequestHandler.backends))}）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
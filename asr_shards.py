@@ -0,0 +1,86 @@
+import multiprocessing
+import queue
+import time
+
+# 多进程分片识别：每个进程各自加载一份模型、限定线程数，按音频总时长均分文件；
+# 结果经队列回到主进程统一写日志/缓存，结束时打印每个进程的利用率，便于选择“进程数 × 线程数”。
+
+def split_by_duration(items, durations, shard_count):
+    # 贪心：时长从长到短依次放进当前总时长最小的分片
+    shards = [[] for _ in range(shard_count)]
+    totals = [0.0] * shard_count
+    for item, duration in sorted(zip(items, durations), key=lambda x: x[1], reverse=True):
+        index = totals.index(min(totals))
+        shards[index].append(item)
+        totals[index] += duration
+    return shards, totals
+
+def _shard_main(worker, index, items, threads, result_queue):
+    start = time.perf_counter()
+    try:
+        emit = lambda *result: result_queue.put(("result", index, result))
+        stats = worker(items, threads, emit) or {}
+        stats["wall_seconds"] = time.perf_counter() - start
+        result_queue.put(("done", index, stats))
+    except BaseException as e:
+        result_queue.put(("error", index, f"{type(e).__name__}: {e}"))
+
+def run_sharded(worker, items, durations, shard_count, threads, on_result, unit="秒"):
+    # worker(items, threads, emit) 在子进程中运行，每完成一个文件调用 emit(...)；
+    # 主进程对每个结果调用 on_result(*result)。durations 的单位为 unit，返回各分片的统计信息。
+    shards, totals = split_by_duration(items, durations, shard_count)
+    context = multiprocessing.get_context("spawn")
+    result_queue = context.Queue()
+    processes = []
+    start = time.perf_counter()
+    for index, shard in enumerate(shards):
+        if not shard:
+            continue
+        process = context.Process(
+            target=_shard_main, args=(worker, index, shard, threads, result_queue), daemon=True
+        )
+        process.start()
+        processes.append((index, process))
+
+    stats = {}
+    running = {index for index, _ in processes}
+    try:
+        while running:
+            try:
+                kind, index, payload = result_queue.get(timeout=1)
+            except queue.Empty:
+                # 子进程被系统杀掉（如 OOM）时不会发消息，这里兜底
+                for index, process in processes:
+                    if index in running and not process.is_alive() and result_queue.empty():
+                        print(f"分片 {index} 异常退出，退出码 {process.exitcode}")
+                        running.discard(index)
+                continue
+            if kind == "result":
+                on_result(*payload)
+            elif kind == "done":
+                stats[index] = payload
+                running.discard(index)
+            else:
+                print(f"分片 {index} 出错: {payload}")
+                running.discard(index)
+    finally:
+        for _, process in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+
+    wall = max(time.perf_counter() - start, 1e-9)
+    print(f"\n分片统计（{len(processes)} 个进程 × {threads} 线程，总用时 {wall:.1f} 秒）:")
+    for index, process in processes:
+        s = stats.get(index)
+        if s is None:
+            print(f"  分片 {index}: 未完成")
+            continue
+        busy = s.get("busy_seconds", 0.0)
+        print(
+            f"  分片 {index}: {len(shards[index])} 个文件，音频 {totals[index]:.1f} {unit}，"
+            f"加载模型 {s.get('load_seconds', 0.0):.1f} 秒，推理 {busy:.1f} 秒，"
+            f"利用率 {busy / wall:.0%}"
+        )
+    print(f"  吞吐: {len(items) / wall:.2f} 文件/秒，{sum(totals) / wall:.2f} {unit}音频/秒")
+    return stats
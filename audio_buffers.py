@@ -0,0 +1,62 @@
+import subprocess
+import numpy as np
+
+# 内存音频转识别用的单声道 float32 波形：合并/转换工具手里已有 PCM 时直接交给识别，不必导出 MP3 再解码。
+# AudioSegment.raw_data 用 np.frombuffer 直接看成整数数组，不复制；只有转 float32（和多声道取平均）时产生一份新数组。
+# float32 单声道的 numpy 数组原样使用，完全不复制。
+# 识别脚本按文件路径识别时不需要 pydub，所以这里不在模块级导入它：AudioSegment 按属性识别，ffmpeg 路径用到时再查。
+
+SAMPLE_WIDTH_DTYPES = {1: np.int8, 2: np.int16, 4: np.int32}
+
+def ffmpeg_binary():
+    # 与其他工具一样沿用 pydub 配置的 ffmpeg 路径；没有装 pydub 时用 PATH 里的 ffmpeg
+    try:
+        from pydub import AudioSegment
+    except ImportError:
+        return "ffmpeg"
+    return AudioSegment.converter
+
+def is_segment(audio):
+    # pydub.AudioSegment 或同样带 raw_data / frame_rate / channels / sample_width 的对象
+    return all(hasattr(audio, name) for name in ("raw_data", "frame_rate", "channels", "sample_width"))
+
+def segment_samples(segment):
+    # 返回 (帧数, 声道数) 的整数数组，与 raw_data 共用内存
+    dtype = SAMPLE_WIDTH_DTYPES.get(segment.sample_width)
+    if dtype is None:
+        raise ValueError(f"不支持的位宽: {segment.sample_width * 8} bit")
+    return np.frombuffer(segment.raw_data, dtype=dtype).reshape(-1, segment.channels)
+
+def decode_bytes(data, sample_rate):
+    # 编码后的整段音频（WAV/MP3/OGG 等文件内容）经 stdin 交给 ffmpeg 解码
+    command = [
+        ffmpeg_binary(), "-loglevel", "error", "-i", "pipe:0",
+        "-f", "f32le", "-ac", "1", "-ar", str(sample_rate), "pipe:1",
+    ]
+    result = subprocess.run(command, input=bytes(data), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.decode("utf-8", errors="replace").strip())
+    return np.frombuffer(result.stdout, dtype=np.float32)
+
+def to_waveform(audio, sample_rate=16000, source_rate=None):
+    # audio: AudioSegment / 编码后的 bytes / numpy 数组（整数或浮点 PCM，多声道为 (帧数, 声道数)，需给 source_rate）
+    # 返回 (单声道 float32 波形, 采样率)；采样率与 sample_rate 不同时由调用方重采样
+    if is_segment(audio):
+        samples = segment_samples(audio)
+        source_rate = audio.frame_rate
+    elif isinstance(audio, (bytes, bytearray, memoryview)):
+        return decode_bytes(audio, sample_rate), sample_rate
+    else:
+        samples = np.asarray(audio)
+        if source_rate is None:
+            raise ValueError("numpy 音频需要指定采样率")
+
+    if samples.ndim > 1:
+        waveform = samples.mean(axis=1, dtype=np.float32)
+    else:
+        waveform = samples.astype(np.float32, copy=False)
+    if np.issubdtype(samples.dtype, np.integer):
+        scale = np.float32(np.iinfo(samples.dtype).max + 1)
+        # mean/astype 已经生成了新数组，可以原地缩放
+        waveform /= scale
+    return np.ascontiguousarray(waveform), source_rate
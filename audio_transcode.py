@@ -0,0 +1,42 @@
+import subprocess
+from pydub import AudioSegment
+from pydub.exceptions import CouldntEncodeError
+
+# 公共转码工具：源文件直接交给 ffmpeg 编码，Python 侧不再缓存整段 PCM。
+# 只有需要对音频做处理（调音量等）时才退回 pydub 先解码再导出。
+
+def transcode(src_path, dst_path, format="mp3", bitrate=None, gain_db=0):
+    if gain_db:
+        sound = AudioSegment.from_file(src_path)
+        (sound + gain_db).export(dst_path, format=format, bitrate=bitrate)
+        return
+
+    _run_ffmpeg(["-i", src_path], src_path, dst_path, format, bitrate)
+
+def transcode_bytes(data, dst_path, format="mp3", bitrate=None, pcm_rate=None):
+    # 内存中的整段音频文件（WAV/OGG 等）经 stdin 交给 ffmpeg 编码，不必先落盘；
+    # 指定 pcm_rate 时同一次解码顺带输出该采样率的单声道 float32 PCM（bytes），供识别直接使用
+    extra = ["-f", "f32le", "-ac", "1", "-ar", str(pcm_rate), "pipe:1"] if pcm_rate else []
+    return _run_ffmpeg(["-i", "pipe:0"], "<内存数据>", dst_path, format, bitrate, data, extra)
+
+def _run_ffmpeg(input_args, src_name, dst_path, format, bitrate, input_data=None, extra_outputs=()):
+    # 沿用 pydub 配置的 ffmpeg 路径；去掉封面和元数据，与经过 pydub 导出的结果保持一致
+    command = [AudioSegment.converter]
+    if input_data is None:
+        command.append("-nostdin")  # 从 stdin 读音频时不能加
+    command += ["-y", "-loglevel", "error", *input_args, "-vn", "-map_metadata", "-1"]
+    if bitrate:
+        command += ["-b:a", bitrate]
+    command += ["-f", format, dst_path, *extra_outputs]
+
+    result = subprocess.run(
+        command,
+        input=input_data,
+        stdin=subprocess.DEVNULL if input_data is None else None,
+        stdout=subprocess.PIPE if extra_outputs else subprocess.DEVNULL,
+        stderr=subprocess.PIPE
+    )
+    if result.returncode != 0:
+        message = result.stderr.decode("utf-8", errors="replace").strip()
+        raise CouldntEncodeError(f"ffmpeg 转码失败 ({result.returncode}): {src_name}\n{message}")
+    return result.stdout
@@ -0,0 +1,123 @@
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import wave
+import numpy as np
+
+# 基准测试用的合成数据：全部离线生成，同样的参数和种子每次得到同样的文件。
+#   assets/  随机二进制资源（已按大富翁规则“加密”，文件头解密后是 UnityFS），大小从几十 KB 到几十 MB
+#   clips/   1.wav ~ N.wav，16k 单声道，给 wav2mp3 和两个识别脚本用
+#   voice/   角色语音 OGG，命名同时符合 voicewiki 的 voice_pattern / other_pattern 和合并脚本的 _cn_ 正则
+
+SEED = 20240601
+SCALES = {
+    # assets: [(大小, 个数)]，clips: WAV 个数，characters: 角色数，voice_lines: 每个分类的条数
+    "small": {"assets": [(64 * 1024, 64), (1024 ** 2, 16), (16 * 1024 ** 2, 2)], "clips": 32, "characters": 2, "voice_lines": 2},
+    "medium": {"assets": [(64 * 1024, 512), (1024 ** 2, 128), (16 * 1024 ** 2, 8), (64 * 1024 ** 2, 2)], "clips": 200, "characters": 6, "voice_lines": 3},
+}
+SAMPLE_RATE = 16000
+VOICE_CATEGORIES = ["start", "lead", "hurt", "kill", "die", "ulti"]  # 两个脚本都认的分类
+SFX_TYPES = ["atk_sfx", "reload_sfx", "ulti_sfx"]
+PARAMS_FILE = "fixtures.json"
+
+def default_dir():
+    return os.path.join(tempfile.gettempdir(), "audio-tools-bench")
+
+def find_ffmpeg():
+    try:
+        from pydub import AudioSegment
+        converter = AudioSegment.converter
+    except ImportError:
+        converter = "ffmpeg"
+    return shutil.which(converter)
+
+def xor_encrypt(data, key_byte=0x01, group_size=4):
+    data = bytearray(data)
+    table = bytes(b ^ key_byte for b in range(256))
+    data[0::group_size] = bytes(data[0::group_size]).translate(table)
+    return bytes(data)
+
+def make_assets(directory, spec, rng):
+    os.makedirs(directory, exist_ok=True)
+    for size, count in spec:
+        for i in range(count):
+            body = b"UnityFS\x00" + rng.bytes(max(0, size - 8))
+            with open(os.path.join(directory, f"asset_{size // 1024}k_{i:03d}.ab"), "wb") as f:
+                f.write(xor_encrypt(body))
+
+def tone(seconds, rng, sample_rate=SAMPLE_RATE):
+    # 几段不同频率的“音节”夹着短停顿，让静音切分和解码都有事可做
+    parts = []
+    total = int(seconds * sample_rate)
+    while total > 0:
+        length = min(total, int(rng.uniform(0.15, 0.6) * sample_rate))
+        n = np.arange(length)
+        amplitude = 0.0 if rng.random() < 0.25 else 0.3
+        parts.append(amplitude * np.sin(2 * np.pi * rng.uniform(150, 900) * n / sample_rate))
+        total -= length
+    samples = np.concatenate(parts) + rng.uniform(-0.01, 0.01, sum(len(p) for p in parts))
+    return (samples * 32767).astype("<i2").tobytes()
+
+def write_wav(path, pcm, sample_rate=SAMPLE_RATE):
+    with wave.open(path, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        w.writeframes(pcm)
+
+def make_clips(directory, count, rng):
+    # 大部分 1~8 秒，每 16 个里有一个超过 30 秒的长音频（覆盖 Whisper 的分段逻辑）
+    os.makedirs(directory, exist_ok=True)
+    for i in range(1, count + 1):
+        seconds = rng.uniform(31, 45) if i % 16 == 0 else rng.uniform(1, 8)
+        write_wav(os.path.join(directory, f"{i}.wav"), tone(seconds, rng))
+
+def make_voice(directory, characters, lines, rng, ffmpeg):
+    # 先写 WAV，再用 ffmpeg 转成 OGG(Vorbis)
+    os.makedirs(directory, exist_ok=True)
+    names = []
+    for c in range(characters):
+        name = f"hero{c}"
+        for category in VOICE_CATEGORIES:
+            for n in range(1, lines + 1):
+                names.append(f"{name}_{category}_vo_{n:02d}")
+                names.append(f"{name}_cn_{category}_vo_{n:02d}")
+        for sfx in SFX_TYPES:
+            names.append(f"{name}_{sfx}_{1:02d}")
+    for stem in names:
+        wav_path = os.path.join(directory, stem + ".wav")
+        write_wav(wav_path, tone(rng.uniform(0.5, 2.5), rng))
+        subprocess.run(
+            [ffmpeg, "-nostdin", "-y", "-loglevel", "error", "-i", wav_path, "-c:a", "libvorbis", "-q:a", "3",
+             os.path.join(directory, stem + ".ogg")],
+            check=True
+        )
+        os.remove(wav_path)
+
+def ensure_fixtures(directory, scale="small"):
+    # 参数与上次生成的一致时直接复用，否则整体重建；返回各子目录的路径
+    params = {"seed": SEED, "scale": scale, **SCALES[scale]}
+    paths = {kind: os.path.join(directory, kind) for kind in ("assets", "clips", "voice")}
+    params_path = os.path.join(directory, PARAMS_FILE)
+    try:
+        with open(params_path, "r", encoding="utf-8") as f:
+            if json.load(f) == json.loads(json.dumps(params)):
+                return paths
+    except (OSError, ValueError):
+        pass
+
+    print(f"生成测试数据（{scale}）: {directory}")
+    shutil.rmtree(directory, ignore_errors=True)
+    rng = np.random.default_rng(SEED)
+    make_assets(paths["assets"], params["assets"], rng)
+    make_clips(paths["clips"], params["clips"], rng)
+    ffmpeg = find_ffmpeg()
+    if ffmpeg:
+        make_voice(paths["voice"], params["characters"], params["voice_lines"], rng, ffmpeg)
+    else:
+        print("未找到 ffmpeg，跳过 OGG 语音数据（voicewiki / merge 基准不可用）")
+    with open(params_path, "w", encoding="utf-8") as f:
+        json.dump(params, f)
+    return paths
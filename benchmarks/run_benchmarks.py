@@ -0,0 +1,374 @@
+import argparse
+import json
+import math
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import types
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fixtures import SCALES, default_dir, ensure_fixtures
+from tool_loader import load_tool
+
+try:
+    import resource  # Windows 上没有，峰值内存记为 null
+except ImportError:
+    resource = None
+
+# 基准测试：在合成数据上按不同并发数运行各脚本的处理阶段，输出吞吐、单个文件耗时分位数和峰值内存（JSON），
+# 便于比较改动前后的性能。每个 阶段×并发数 在独立子进程中运行，峰值内存互不影响。
+#
+#   python benchmarks/run_benchmarks.py --workers 1,4 --output bench.json
+#
+# 识别阶段默认用桩模型（不跑真实模型，只测解码/预取/分批等外围开销），
+# --whisper 可指定本地小模型目录，--funasr real 使用脚本里配置的模型（需要已下载）。
+
+STAGES = ["decrypt", "wav2mp3", "voicewiki", "merge", "funasr", "whisper"]
+RESULT_MARKER = "BENCH_RESULT "
+
+DECRYPT_TOOL = "richman-asset-file-xor-decypt.py"
+CONVERT_TOOL = "wav2mp3-add-prefix.py"
+VOICEWIKI_TOOL = "bs-raw-file-1way2-voicewiki.py"
+MERGE_TOOL = "bs-zh-en-audio-merge-for-vid.py"
+FUNASR_TOOL = "funasr-based-audio2txt-richman.py"
+WHISPER_TOOL = "whisper-based-audio2txt.py"
+STUB_TEXT = "测试"
+
+# ---------- 子进程：运行单个阶段 ----------
+_tools = {}
+
+def _tool(filename):
+    if filename not in _tools:
+        _tools[filename] = load_tool(filename)
+    return _tools[filename]
+
+def _timed(tool, func, *args):
+    # 在线程/进程池的 worker 中调用脚本函数，返回 (耗时, 是否成功)；脚本函数返回 False 或抛异常都算失败
+    start = time.perf_counter()
+    try:
+        ok = getattr(_tool(tool), func)(*args) is not False
+    except Exception:
+        ok = False
+    return time.perf_counter() - start, ok
+
+def run_units(tool, func, jobs, workers, processes=False):
+    # jobs 为 [(字节数, 参数元组)]；workers 为 1 时与脚本一样在单个 worker 中逐个处理
+    # 失败的文件不计入吞吐和延迟，只记个数
+    executor = ProcessPoolExecutor if processes and workers > 1 else ThreadPoolExecutor
+    start = time.perf_counter()
+    with executor(max_workers=workers) as pool:
+        futures = [pool.submit(_timed, tool, func, *args) for _, args in jobs]
+        results = [future.result() for future in futures]
+    ok = [(size, latency) for (size, _), (latency, success) in zip(jobs, results) if success]
+    return {
+        "wall_seconds": time.perf_counter() - start,
+        "latencies": [latency for _, latency in ok],
+        "bytes": sum(size for size, _ in ok),
+        "failed": len(jobs) - len(ok),
+    }
+
+def bench_decrypt(paths, workers, workdir, args):
+    # 另存模式（decrypt_to_file），不改动测试数据；与脚本一样大文件优先
+    jobs = []
+    for fname in os.listdir(paths["assets"]):
+        in_path = os.path.join(paths["assets"], fname)
+        jobs.append((os.path.getsize(in_path), (in_path, os.path.join(workdir, fname + "_decrypted"))))
+    jobs.sort(key=lambda job: job[0], reverse=True)
+    return run_units(DECRYPT_TOOL, "decrypt_file", jobs, workers, processes=True)
+
+def bench_wav2mp3(paths, workers, workdir, args):
+    prefix = _tool(CONVERT_TOOL).PREFIX
+    jobs = []
+    for fname in sorted(os.listdir(paths["clips"])):
+        wav_path = os.path.join(paths["clips"], fname)
+        mp3_path = os.path.join(workdir, prefix + os.path.splitext(fname)[0] + ".mp3")
+        jobs.append((os.path.getsize(wav_path), (wav_path, mp3_path)))
+    return run_units(CONVERT_TOOL, "convert_one", jobs, workers)
+
+def bench_voicewiki(paths, workers, workdir, args):
+    # 跑完整的 main()（会在输入目录下建 output/，所以先复制一份），并统计每个 MP3 的编码耗时
+    input_folder = os.path.join(workdir, "voice")
+    shutil.copytree(paths["voice"], input_folder)
+    tool = _tool(VOICEWIKI_TOOL)
+    latencies = []
+    converted_bytes = []
+    failed = []
+    convert_cached = tool.convert_cached
+
+    def timed_convert(cache, ogg_path, *convert_args):
+        start = time.perf_counter()
+        ok = False
+        try:
+            ok = convert_cached(cache, ogg_path, *convert_args)
+            return ok
+        finally:
+            # 只统计转换成功的 MP3；list.append 在线程间是原子的
+            if ok:
+                latencies.append(time.perf_counter() - start)
+                converted_bytes.append(os.path.getsize(ogg_path))
+            else:
+                failed.append(ogg_path)
+
+    tool.convert_cached = timed_convert
+    sys.argv = [VOICEWIKI_TOOL, input_folder, "--workers", str(workers)]
+    start = time.perf_counter()
+    tool.main()
+    return {
+        "wall_seconds": time.perf_counter() - start,
+        "latencies": latencies,
+        "bytes": sum(converted_bytes),
+        "failed": len(failed),
+    }
+
+def bench_merge(paths, workers, workdir, args):
+    # 与 batch_merge 相同：每个角色一个任务，多进程并行
+    characters = _tool(MERGE_TOOL).group_by_character(paths["voice"])
+    jobs = []
+    for name, categorized_files in sorted(characters.items()):
+        size = sum(os.path.getsize(path) for cat in categorized_files.values() for files in cat.values() for _, path in files)
+        jobs.append((size, (categorized_files, os.path.join(workdir, f"{name}-cn.mp3"))))
+    return run_units(MERGE_TOOL, "render_merge", jobs, workers, processes=True)
+
+class StubAutoModel:
+    # 桩模型：不做推理，每段音频返回固定文本
+    def __init__(self, **kwargs):
+        pass
+
+    def generate(self, input, **kwargs):
+        items = input if isinstance(input, list) else [input]
+        return [{"key": str(i), "text": STUB_TEXT} for i in range(len(items))]
+
+def transcribe_timed(asr, transcribe, files, sizes):
+    # 识别阶段的单个文件延迟：每批 recognize_batch 的推理耗时平均到批内每个文件上，
+    # 与其他阶段的“每个文件的处理时间”可比；结果为 None（识别失败）或没有回调的文件算失败
+    latencies = []
+    done_bytes = 0
+    recognize_batch = asr.recognize_batch
+
+    def timed_batch(*batch_args):
+        start = time.perf_counter()
+        texts = recognize_batch(*batch_args)
+        per_file = (time.perf_counter() - start) / max(1, len(texts))
+        latencies.extend(per_file for text in texts if text is not None)
+        return texts
+
+    def emit(filename, *result):
+        nonlocal done_bytes
+        if result[-1] is not None:
+            done_bytes += sizes[filename]
+
+    asr.recognize_batch = timed_batch
+    start = time.perf_counter()
+    try:
+        transcribe(files, emit)
+    finally:
+        asr.recognize_batch = recognize_batch
+    return {
+        "wall_seconds": time.perf_counter() - start,
+        "latencies": latencies,
+        "bytes": done_bytes,
+        "failed": len(files) - len(latencies),
+    }
+
+def clip_files(clips_dir):
+    # 返回按数字排序的文件名和 文件名 -> 字节数
+    files = sorted(os.listdir(clips_dir), key=lambda x: int(os.path.splitext(x)[0]))
+    return files, {f: os.path.getsize(os.path.join(clips_dir, f)) for f in files}
+
+def bench_funasr(paths, workers, workdir, args):
+    if args.funasr == "stub":
+        try:
+            import funasr  # noqa: F401
+        except ImportError:
+            sys.modules["funasr"] = types.SimpleNamespace(AutoModel=StubAutoModel)
+    asr = _tool(FUNASR_TOOL)
+    if args.funasr == "stub":
+        asr.AutoModel = StubAutoModel
+    asr.AUDIO_DIR = paths["clips"]
+    start = time.perf_counter()
+    model = asr.init_model(ncpu=workers)
+    load_seconds = time.perf_counter() - start
+    files, sizes = clip_files(paths["clips"])
+    result = transcribe_timed(asr, lambda files, emit: asr.transcribe_pending(model, files, emit), files, sizes)
+    result["load_seconds"] = load_seconds
+    return result
+
+def bench_whisper(paths, workers, workdir, args):
+    import torch
+    asr = _tool(WHISPER_TOOL)
+    asr.AUDIO_DIR = paths["clips"]
+    asr.LOADER_WORKERS = workers
+    asr.WAVEFORM_CACHE_DIR = None
+    torch.set_num_threads(workers)
+    start = time.perf_counter()
+    if args.whisper == "stub":
+        # 保留真实的加载、重采样、分段和特征提取，只把 generate 换掉
+        from transformers import WhisperFeatureExtractor
+        processor, model = types.SimpleNamespace(feature_extractor=WhisperFeatureExtractor()), None
+        asr.generate_texts = lambda processor, model, features: [STUB_TEXT] * len(features)
+    else:
+        asr.MODEL_NAME = args.whisper
+        processor, model = asr.init_model()
+    load_seconds = time.perf_counter() - start
+    files, sizes = clip_files(paths["clips"])
+    result = transcribe_timed(asr, lambda files, emit: asr.transcribe_pending(processor, model, files, emit),
+                                   [(f, None) for f in files], sizes)
+    result["load_seconds"] = load_seconds
+    return result
+
+BENCHMARKS = {
+    "decrypt": bench_decrypt,
+    "wav2mp3": bench_wav2mp3,
+    "voicewiki": bench_voicewiki,
+    "merge": bench_merge,
+    "funasr": bench_funasr,
+    "whisper": bench_whisper,
+}
+
+def percentile(values, p):
+    # 最近秩法
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = math.ceil(p / 100 * len(ordered))
+    return ordered[min(len(ordered), max(1, rank)) - 1]
+
+def peak_rss_mb(who):
+    if resource is None:
+        return None
+    peak = resource.getrusage(who).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+def run_child(args):
+    # 脚本自身的输出全部丢弃，结果单独一行写到真正的 stdout
+    real_stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w", encoding="utf-8")
+    paths = ensure_fixtures(args.fixtures, args.scale)
+    workdir = tempfile.mkdtemp(prefix=f"bench-{args.child}-")
+    try:
+        result = BENCHMARKS[args.child](paths, args.child_workers, workdir, args)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    latencies = result.pop("latencies")
+    failed = result.pop("failed")
+    wall = max(result.pop("wall_seconds"), 1e-9)
+    report = {
+        "stage": args.child,
+        "workers": args.child_workers,
+        "items": len(latencies),
+        "failed": failed,
+        "bytes": result.pop("bytes"),
+        "wall_seconds": round(wall, 4),
+        "items_per_second": round(len(latencies) / wall, 3),
+        "latency_ms": {
+            name: round(percentile(latencies, p) * 1000, 2) if latencies else None
+            for name, p in (("p50", 50), ("p90", 90), ("p99", 99), ("max", 100))
+        },
+        "peak_rss_mb": peak_rss_mb(resource.RUSAGE_SELF) if resource else None,
+        "peak_children_rss_mb": peak_rss_mb(resource.RUSAGE_CHILDREN) if resource else None,
+    }
+    report["mb_per_second"] = round(report["bytes"] / 1024 / 1024 / wall, 3)
+    if failed:
+        # 有失败时吞吐只反映成功的部分，不能与正常结果直接比较
+        report["error"] = f"{failed}/{failed + len(latencies)} 个失败"
+    report.update({k: round(v, 4) if isinstance(v, float) else v for k, v in result.items()})
+    real_stdout.write(RESULT_MARKER + json.dumps(report, ensure_ascii=False) + "\n")
+
+# ---------- 主进程：调度各阶段 ----------
+def run_one(args, stage, workers):
+    command = [
+        sys.executable, os.path.abspath(__file__), "--child", stage, "--child-workers", str(workers),
+        "--fixtures", args.fixtures, "--scale", args.scale, "--funasr", args.funasr, "--whisper", args.whisper,
+    ]
+    proc = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    for line in proc.stdout.decode("utf-8", errors="replace").splitlines():
+        if line.startswith(RESULT_MARKER):
+            return json.loads(line[len(RESULT_MARKER):])
+    error = proc.stderr.decode("utf-8", errors="replace").strip().splitlines()
+    return {"stage": stage, "workers": workers, "error": error[-1] if error else f"退出码 {proc.returncode}"}
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, check=True).stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="音频工具基准测试")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"逗号分隔，可选: {','.join(STAGES)}")
+    parser.add_argument("--workers", default=f"1,{os.cpu_count() or 1}", help="逗号分隔的并发数列表")
+    parser.add_argument("--repeat", type=int, default=1, help="每个组合运行的次数")
+    parser.add_argument("--scale", default="small", choices=sorted(SCALES))
+    parser.add_argument("--fixtures", default=default_dir(), help="测试数据目录（参数不变时复用）")
+    parser.add_argument("--funasr", default="stub", choices=["stub", "real"], help="FunASR 使用桩模型或真实模型")
+    parser.add_argument("--whisper", default="stub", help="stub 或本地 Whisper 模型目录/名称")
+    parser.add_argument("--output", help="JSON 结果文件，不填则只打印")
+    parser.add_argument("--child", choices=STAGES, help=argparse.SUPPRESS)
+    parser.add_argument("--child-workers", type=int, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    if args.child:
+        run_child(args)
+        return
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = [s for s in stages if s not in BENCHMARKS]
+    if unknown:
+        print(f"未知阶段: {', '.join(unknown)}")
+        return
+    worker_counts = sorted({int(w) for w in args.workers.split(",")})
+    ensure_fixtures(args.fixtures, args.scale)
+
+    results = []
+    for stage in stages:
+        for workers in worker_counts:
+            for run in range(args.repeat):
+                result = run_one(args, stage, workers)
+                result["run"] = run
+                results.append(result)
+                if "items" not in result:
+                    print(f"{stage:<10} ×{workers:<3} 失败: {result['error']}")
+                else:
+                    latency = result["latency_ms"]
+                    print(
+                        f"{stage:<10} ×{workers:<3} {result['items']} 个，{result['wall_seconds']:.2f} 秒，"
+                        f"{result['items_per_second']:.1f} 个/秒，{result['mb_per_second']:.1f} MB/秒，"
+                        f"p50/p90/p99 {latency['p50']}/{latency['p90']}/{latency['p99']} ms，"
+                        f"峰值内存 {result['peak_rss_mb'] or 0:.0f} MB"
+                        + (f"，出错: {result['error']}" if "error" in result else "")
+                    )
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "scale": args.scale,
+            "funasr": args.funasr,
+            "whisper": args.whisper,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.output}")
+    else:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
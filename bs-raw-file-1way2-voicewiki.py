@@ -1,7 +1,13 @@
+import argparse
+import io
+import json
 import os
 import re
 import shutil
-from pydub import AudioSegment
+from concurrent.futures import ThreadPoolExecutor
+from audio_transcode import transcode
+from transcribe_journal import file_digest
+import perf_report
 
 # 条件映射字典（包含单数和复数形式）
 CONDITION_MAPPING = {
@@ -29,6 +35,18 @@ OTHER_SFX_MAPPING = {
     # 可以添加更多音效类型映射
 }
 
+# 增量构建缓存（放在 output 文件夹中），记录每个 MP3 对应源文件的大小/修改时间/哈希
+BUILD_CACHE_NAME = ".build-cache.json"
+
+# 并行编码数（每个 worker 同时跑一个 ffmpeg）
+WORKERS = os.cpu_count() or 1
+
+# 正则表达式模式
+# 匹配标准语音文件（支持名字中包含下划线）
+voice_pattern = re.compile(r'^(?P<name>.+?)_(?P<condition>start|starts|lead|leads|hurt|hurts|kill|kills|die|dies|ulti|ultis)_vo_(?P<number>\d+)\.ogg$', re.IGNORECASE)
+# 匹配其他音效文件（支持名字中包含下划线）
+other_pattern = re.compile(r'^(?P<name>.+?)_(?P<type>atk_sfx|atk_hit|atk_flyback_sfx|reload_sfx|dryfire_sfx|ulti_sfx|.+?)_(?P<number>\d+)\.ogg$', re.IGNORECASE)
+
 def normalize_condition(condition):
     """将复数条件词转换为单数形式"""
     if condition.endswith('s'):
@@ -37,9 +55,209 @@ def normalize_condition(condition):
             return singular
     return condition
 
+def load_build_cache(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"警告: 构建缓存 '{path}' 读取失败，将全部重新转换: {e}")
+        return {}
+
+def save_build_cache(path, cache):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+def is_up_to_date(cache, ogg_path, mp3_filename, mp3_path):
+    """源文件与上次转换时一致且MP3仍存在时返回True"""
+    entry = cache.get(mp3_filename)
+    if entry is None or entry['source'] != os.path.basename(ogg_path) or not os.path.exists(mp3_path):
+        return False
+    stat = os.stat(ogg_path)
+    if stat.st_size != entry['size']:
+        return False
+    if stat.st_mtime_ns == entry['mtime_ns']:
+        return True
+    # 只有修改时间变了：按内容哈希确认
+    if file_digest(ogg_path) == entry['hash']:
+        entry['mtime_ns'] = stat.st_mtime_ns
+        return True
+    return False
+
+def convert_cached(cache, ogg_path, mp3_filename, mp3_path):
+    """转换单个OGG，未变化的文件直接跳过；失败时返回False"""
+    ogg_filename = os.path.basename(ogg_path)
+    try:
+        if is_up_to_date(cache, ogg_path, mp3_filename, mp3_path):
+            perf_report.count("voicewiki.up_to_date")
+            return True
+        with perf_report.stage("voicewiki.ffmpeg"):
+            transcode(ogg_path, mp3_path, format="mp3")
+        perf_report.count("voicewiki.converted")
+        stat = os.stat(ogg_path)
+        cache[mp3_filename] = {
+            'source': ogg_filename,
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'hash': file_digest(ogg_path),
+        }
+        print(f"已转换: {ogg_filename} -> {mp3_filename}")
+        return True
+    except Exception as e:
+        cache.pop(mp3_filename, None)
+        print(f"错误: 无法转换文件 '{ogg_filename}': {str(e)}")
+        return False
+
+def write_if_changed(path, content):
+    """内容与已有文件相同则不重写，返回是否写入"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            if f.read() == content:
+                return False
+    except (OSError, UnicodeDecodeError):
+        pass
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    return True
+
+def classify_file(filename):
+    """按命名模式解析文件名，返回 (name, file_info)，不匹配时返回 (None, None)"""
+    # 首先尝试匹配标准语音文件
+    match = voice_pattern.match(filename)
+    if match:
+        name = match.group('name')
+        condition = match.group('condition').lower()
+        number = int(match.group('number'))
+        
+        # 规范化条件词
+        normalized_condition = normalize_condition(condition)
+        
+        return name, {
+            'filename': filename,
+            'number': number,
+            'type': 'voice',
+            'condition': normalized_condition
+        }
+    
+    # 如果不是标准语音文件，尝试匹配其他音效
+    match = other_pattern.match(filename)
+    if match:
+        name = match.group('name')
+        sound_type = match.group('type').lower()
+        number = int(match.group('number'))
+        
+        # 查找音效类型映射，如果没有找到则使用通用描述
+        if sound_type in OTHER_SFX_MAPPING:
+            script = OTHER_SFX_MAPPING[sound_type]['script']
+            translation = OTHER_SFX_MAPPING[sound_type]['translation']
+        else:
+            script = sound_type.replace('_', ' ').title()
+            translation = f"{script}音效"
+        
+        return name, {
+            'filename': filename,
+            'number': number,
+            'type': 'other',
+            'sound_type': sound_type,
+            'script': script,
+            'translation': translation
+        }
+    
+    return None, None
+
+def scan_folder(input_folder):
+    """第一阶段：扫描并分类文件，只做文件名匹配，不碰音频内容"""
+    # 格式: {name: {type: [file_info]}}
+    files_data = {}
+    
+    with os.scandir(input_folder) as entries:
+        for entry in entries:
+            filename = entry.name
+            if not filename.lower().endswith('.ogg') or not entry.is_file():
+                continue
+            
+            name, file_info = classify_file(filename)
+            
+            # 如果成功匹配任何一种模式，则添加到数据结构中
+            if name and file_info:
+                files_data.setdefault(name, {}).setdefault(file_info['type'], []).append(file_info)
+            else:
+                print(f"警告: 文件 '{filename}' 不符合命名模式，已跳过。")
+    
+    return files_data
+
+def plan_page(name, types):
+    """生成一个名字的页面结构: [(标题行, [(ogg文件名, mp3文件名, 条目行)])]"""
+    sections = []
+    
+    # 处理标准语音文件
+    if 'voice' in types:
+        # 按条件排序
+        conditions_dict = {}
+        for file_info in types['voice']:
+            conditions_dict.setdefault(file_info['condition'], []).append(file_info)
+        
+        sorted_conditions = sorted(
+            conditions_dict.items(), 
+            key=lambda x: CONDITION_MAPPING[x[0]]['order']
+        )
+        
+        for condition, files in sorted_conditions:
+            chinese_name = CONDITION_MAPPING[condition]['chinese']
+            entries = []
+            # 按编号排序文件
+            for file_info in sorted(files, key=lambda x: x['number']):
+                number_str = f"{file_info['number']:02d}"  # 两位数字格式
+                mp3_filename = f"BS_{name}_{condition}_vo_{number_str}.mp3"
+                line = f"{{{{BSAudio|File = {mp3_filename}|Script = |Translation = }}}}\n"
+                entries.append((file_info['filename'], mp3_filename, line))
+            sections.append((f"=={chinese_name}==\n", entries))
+    
+    # 处理其他音效文件
+    if 'other' in types:
+        entries = []
+        # 按音效类型和编号排序
+        sorted_files = sorted(
+            types['other'], 
+            key=lambda x: (x['sound_type'], x['number'])
+        )
+        for file_info in sorted_files:
+            number_str = f"{file_info['number']:02d}"  # 两位数字格式
+            mp3_filename = f"BS_{name}_{file_info['sound_type']}_{number_str}.mp3"
+            script = file_info['script']
+            translation = file_info['translation']
+            line = f"{{{{BSAudio|File = {mp3_filename}|Script = {script}|Translation = {translation}}}}}\n"
+            entries.append((file_info['filename'], mp3_filename, line))
+        sections.append((f"== 其他音效 ==\n", entries))
+    
+    return sections
+
+def render_page(sections, is_converted):
+    """第三阶段：拼出TXT内容，转换失败的文件不写条目（每段后保留空行）"""
+    with io.StringIO() as txt_file:
+        for header, entries in sections:
+            txt_file.write(header)
+            for _, mp3_filename, line in entries:
+                if is_converted(mp3_filename):
+                    txt_file.write(line)
+            txt_file.write("\n")
+        return txt_file.getvalue()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="把OGG语音转换为MP3并生成BSAudio维基文本")
+    parser.add_argument("input_folder", nargs="?", help="包含OGG文件的文件夹路径（不填则交互输入）")
+    parser.add_argument("--dry-run", action="store_true", help="只生成TXT，不转换音频")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="并行编码数")
+    return parser.parse_args()
+
 def main():
+    args = parse_args()
+    
     # 获取输入文件夹路径
-    input_folder = input("请输入包含OGG文件的文件夹路径: ").strip()
+    input_folder = args.input_folder or input("请输入包含OGG文件的文件夹路径: ").strip()
     
     # 检查文件夹是否存在
     if not os.path.exists(input_folder):
@@ -52,177 +270,61 @@ def main():
     
     # 创建MP3输出文件夹
     mp3_folder = os.path.join(output_folder, "mp3")
-    os.makedirs(mp3_folder, exist_ok=True)
+    if not args.dry_run:
+        os.makedirs(mp3_folder, exist_ok=True)
     
-    # 初始化数据结构来存储文件信息
-    # 格式: {name: {condition: [file_info]}}
-    files_data = {}
+    # 读取增量构建缓存
+    cache_path = os.path.join(output_folder, BUILD_CACHE_NAME)
+    build_cache = load_build_cache(cache_path)
     
-    # 正则表达式模式
-    # 匹配标准语音文件（支持名字中包含下划线）
-    voice_pattern = re.compile(r'^(?P<name>.+?)_(?P<condition>start|starts|lead|leads|hurt|hurts|kill|kills|die|dies|ulti|ultis)_vo_(?P<number>\d+)\.ogg$', re.IGNORECASE)
-    # 匹配其他音效文件（支持名字中包含下划线）
-    other_pattern = re.compile(r'^(?P<name>.+?)_(?P<type>atk_sfx|atk_hit|atk_flyback_sfx|reload_sfx|dryfire_sfx|ulti_sfx|.+?)_(?P<number>\d+)\.ogg$', re.IGNORECASE)
-    
-    # 遍历文件夹中的所有文件
-    for filename in os.listdir(input_folder):
-        if filename.lower().endswith('.ogg'):
-            name = None
-            file_info = None
-            
-            # 首先尝试匹配标准语音文件
-            match = voice_pattern.match(filename)
-            if match:
-                name = match.group('name')
-                condition = match.group('condition').lower()
-                number = int(match.group('number'))
-                
-                # 规范化条件词
-                normalized_condition = normalize_condition(condition)
-                
-                file_info = {
-                    'filename': filename,
-                    'number': number,
-                    'type': 'voice',
-                    'condition': normalized_condition
-                }
-            
-            # 如果不是标准语音文件，尝试匹配其他音效
-            else:
-                match = other_pattern.match(filename)
-                if match:
-                    name = match.group('name')
-                    sound_type = match.group('type').lower()
-                    number = int(match.group('number'))
-                    
-                    # 查找音效类型映射，如果没有找到则使用通用描述
-                    if sound_type in OTHER_SFX_MAPPING:
-                        script = OTHER_SFX_MAPPING[sound_type]['script']
-                        translation = OTHER_SFX_MAPPING[sound_type]['translation']
-                    else:
-                        script = sound_type.replace('_', ' ').title()
-                        translation = f"{script}音效"
-                    
-                    file_info = {
-                        'filename': filename,
-                        'number': number,
-                        'type': 'other',
-                        'sound_type': sound_type,
-                        'script': script,
-                        'translation': translation
-                    }
-            
-            # 如果成功匹配任何一种模式，则添加到数据结构中
-            if name and file_info:
-                if name not in files_data:
-                    files_data[name] = {}
-                
-                file_type = file_info['type']
-                if file_type not in files_data[name]:
-                    files_data[name][file_type] = []
-                
-                files_data[name][file_type].append(file_info)
-            else:
-                print(f"警告: 文件 '{filename}' 不符合命名模式，已跳过。")
+    # 第一阶段：分类
+    with perf_report.stage("voicewiki.scan"):
+        files_data = scan_folder(input_folder)
+        pages = [(name, plan_page(name, types)) for name, types in files_data.items()]
     
-    # 处理并生成输出
-    for name, types in files_data.items():
-        # 为每个名字创建一个TXT文件
-        txt_filename = os.path.join(output_folder, f"{name}.txt")
-        
-        with open(txt_filename, 'w', encoding='utf-8') as txt_file:
-            # 处理标准语音文件
-            if 'voice' in types:
-                # 按条件排序
-                conditions_dict = {}
-                for file_info in types['voice']:
-                    condition = file_info['condition']
-                    if condition not in conditions_dict:
-                        conditions_dict[condition] = []
-                    conditions_dict[condition].append(file_info)
-                
-                sorted_conditions = sorted(
-                    conditions_dict.items(), 
-                    key=lambda x: CONDITION_MAPPING[x[0]]['order']
-                )
-                
-                # 处理每个条件
-                for condition, files in sorted_conditions:
-                    # 写入条件标题
-                    chinese_name = CONDITION_MAPPING[condition]['chinese']
-                    txt_file.write(f"=={chinese_name}==\n")
-                    
-                    # 按编号排序文件
-                    sorted_files = sorted(files, key=lambda x: x['number'])
-                    
-                    # 处理每个文件
-                    for file_info in sorted_files:
-                        ogg_filename = file_info['filename']
-                        number_str = f"{file_info['number']:02d}"  # 两位数字格式
-                        
-                        # 构建MP3文件名
-                        mp3_filename = f"BS_{name}_{condition}_vo_{number_str}.mp3"
-                        mp3_path = os.path.join(mp3_folder, mp3_filename)
-                        
-                        # 转换OGG到MP3
-                        try:
-                            ogg_path = os.path.join(input_folder, ogg_filename)
-                            audio = AudioSegment.from_file(ogg_path, format="ogg")
-                            audio.export(mp3_path, format="mp3")
-                            print(f"已转换: {ogg_filename} -> {mp3_filename}")
-                        except Exception as e:
-                            print(f"错误: 无法转换文件 '{ogg_filename}': {str(e)}")
-                            continue
-                        
-                        # 写入TXT文件
-                        txt_file.write(f"{{{{BSAudio|File = {mp3_filename}|Script = |Translation = }}}}\n")
-                    
-                    # 在每个条件后添加空行
-                    txt_file.write("\n")
-            
-            # 处理其他音效文件
-            if 'other' in types:
-                # 写入其他音效标题
-                txt_file.write(f"== 其他音效 ==\n")
-                
-                # 按音效类型和编号排序
-                sorted_files = sorted(
-                    types['other'], 
-                    key=lambda x: (x['sound_type'], x['number'])
-                )
-                
-                # 处理每个文件
-                for file_info in sorted_files:
-                    ogg_filename = file_info['filename']
-                    sound_type = file_info['sound_type']
-                    number_str = f"{file_info['number']:02d}"  # 两位数字格式
-                    
-                    # 构建MP3文件名
-                    mp3_filename = f"BS_{name}_{sound_type}_{number_str}.mp3"
-                    mp3_path = os.path.join(mp3_folder, mp3_filename)
-                    
-                    # 转换OGG到MP3
-                    try:
-                        ogg_path = os.path.join(input_folder, ogg_filename)
-                        audio = AudioSegment.from_file(ogg_path, format="ogg")
-                        audio.export(mp3_path, format="mp3")
-                        print(f"已转换: {ogg_filename} -> {mp3_filename}")
-                    except Exception as e:
-                        print(f"错误: 无法转换文件 '{ogg_filename}': {str(e)}")
-                        continue
-                    
-                    # 写入TXT文件
-                    script = file_info['script']
-                    translation = file_info['translation']
-                    txt_file.write(f"{{{{BSAudio|File = {mp3_filename}|Script = {script}|Translation = {translation}}}}}\n")
-                
-                # 在其他音效后添加空行
-                txt_file.write("\n")
-        
-        print(f"已生成: {txt_filename}")
+    # 第二阶段：并行编码（同一个MP3只转换一次）
+    jobs = {}
+    for _, sections in pages:
+        for _, entries in sections:
+            for ogg_filename, mp3_filename, _ in entries:
+                jobs[mp3_filename] = os.path.join(input_folder, ogg_filename)
+    
+    futures = {}
+    pool = None
+    if not args.dry_run:
+        pool = ThreadPoolExecutor(max_workers=max(1, args.workers))
+        for mp3_filename, ogg_path in jobs.items():
+            mp3_path = os.path.join(mp3_folder, mp3_filename)
+            futures[mp3_filename] = pool.submit(convert_cached, build_cache, ogg_path, mp3_filename, mp3_path)
+    
+    def is_converted(mp3_filename):
+        return args.dry_run or futures[mp3_filename].result()
+    
+    # 第三阶段：按页输出TXT，只等待本页用到的编码任务
+    try:
+        for name, sections in pages:
+            txt_filename = os.path.join(output_folder, f"{name}.txt")
+            with perf_report.stage("voicewiki.wait_encode"):
+                page = render_page(sections, is_converted)
+            with perf_report.stage("voicewiki.write_txt"):
+                changed = write_if_changed(txt_filename, page)
+            if changed:
+                print(f"已生成: {txt_filename}")
+            else:
+                print(f"未变化: {txt_filename}")
+    except BaseException:
+        # Ctrl-C 或出错时取消还在排队的编码任务，只等正在运行的几个结束
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        raise
+    finally:
+        if pool is not None:
+            pool.shutdown()
+            save_build_cache(cache_path, build_cache)
     
     print("处理完成!")
-    print(f"MP3文件保存在: {mp3_folder}")
+    if not args.dry_run:
+        print(f"MP3文件保存在: {mp3_folder}")
     print(f"TXT文件保存在: {output_folder}")
 
 if __name__ == "__main__":
@@ -1,29 +1,114 @@
 import os
 import re
+import time
+import wave
+from concurrent.futures import ProcessPoolExecutor
 from pydub import AudioSegment
+from transcribe_journal import file_digest
+import perf_report
 
-def merge_ogg_files(character_name, input_directory, output_file):
-    # 定义分类词列表（按照需要的顺序）
-    categories = ['start', 'lead', 'hurt', 'kill', 'die', 'atk', 'ulti']
-    category_pattern = '|'.join(categories)
+# 定义分类词列表（按照需要的顺序）
+CATEGORIES = ['start', 'lead', 'hurt', 'kill', 'die', 'atk', 'ulti']
+
+# 静音间隔（毫秒）：中英混合用 400/600，纯中文两者都设为 500 左右
+GAP_MS = 400      # 不带CN的文件之后
+CN_GAP_MS = 600   # 带CN的文件之后
+
+# 解码后的 PCM 缓存目录（按文件内容哈希命名），调整间隔重新合并时不必再解码 OGG；设为 None 则不缓存
+CLIP_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "audio-merge", "clips")
+
+# 批量模式下同时合并的角色数
+WORKERS = os.cpu_count() or 1
+
+# 合并后直接把内存中的 PCM 交给识别（"whisper" 或 "funasr"），文字写到 MP3 旁的同名 .txt；None 则不识别
+CAPTION_BACKEND = None
+
+# 批量模式：一次匹配出角色名，按角色分组
+BATCH_PATTERN = re.compile(
+    rf'(?P<name>.+?)(?P<cn>_cn)?_(?P<category>{"|".join(CATEGORIES)})(?:_vo)?_(?P<number>\d+)\.ogg',
+    re.IGNORECASE
+)
+
+def join_segments(segments):
+    # 一次性拼接所有片段，避免 final_audio += ... 每次都复制已累积的音频（平方复杂度）
+    # 先统一到最大的声道数/采样率/位宽，与 pydub 逐段相加时的同步规则一致
+    if not segments:
+        return AudioSegment.empty()
+    channels = max(seg.channels for seg in segments)
+    frame_rate = max(seg.frame_rate for seg in segments)
+    sample_width = max(seg.sample_width for seg in segments)
+    data = b"".join(
+        seg.set_channels(channels).set_frame_rate(frame_rate).set_sample_width(sample_width).raw_data
+        for seg in segments
+    )
+    return AudioSegment(data=data, sample_width=sample_width, frame_rate=frame_rate, channels=channels)
+
+def load_clip(path, cache_dir=None):
+    # 读取 OGG；指定缓存目录时，解码结果以 WAV(PCM) 形式按内容哈希缓存
+    if not cache_dir:
+        with perf_report.stage("merge.decode"):
+            return AudioSegment.from_ogg(path)
+
+    digest = file_digest(path)
+    cache_path = os.path.join(cache_dir, f"{digest}.wav")
+    if os.path.exists(cache_path):
+        perf_report.count("merge.clip_cache_hits")
+        with perf_report.stage("merge.read_cache"), wave.open(cache_path, 'rb') as w:
+            return AudioSegment(
+                data=w.readframes(w.getnframes()),
+                sample_width=w.getsampwidth(),
+                frame_rate=w.getframerate(),
+                channels=w.getnchannels()
+            )
+
+    with perf_report.stage("merge.decode"):
+        audio = AudioSegment.from_ogg(path)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with wave.open(tmp_path, 'wb') as w:
+        w.setnchannels(audio.channels)
+        w.setsampwidth(audio.sample_width)
+        w.setframerate(audio.frame_rate)
+        w.writeframes(audio.raw_data)
+    os.replace(tmp_path, cache_path)
+    return audio
+
+def caption_audio(audio, output_file, recognize):
+    # 不经过 MP3 编解码，直接识别合并结果
+    with perf_report.stage("merge.caption"):
+        text = recognize(audio)
+    if text is None:
+        print(f"识别失败: {output_file}")
+        return None
+    txt_file = os.path.splitext(output_file)[0] + ".txt"
+    with open(txt_file, 'w', encoding='utf-8') as f:
+        f.write(f"{text}\n")
+    print(f"识别结果: {txt_file}")
+    return text
+
+def merge_ogg_files(character_name, input_directory, output_file,
+                    gap_ms=GAP_MS, cn_gap_ms=CN_GAP_MS, cache_dir=CLIP_CACHE_DIR, recognize=None):
+    category_pattern = '|'.join(CATEGORIES)
 
     regex = rf'{re.escape(character_name)}(_cn)?_({category_pattern})(?:_vo)?_(\d+)\.ogg'
 
     # 用于存储每个分类的音频文件
-    categorized_files = {cat: {'cn': [], 'non_cn': []} for cat in categories}
+    categorized_files = {cat: {'cn': [], 'non_cn': []} for cat in CATEGORIES}
     
     # 跟踪未匹配的文件
     unmatched_files = []
     
   # 遍历目录中的所有文件
-    for filename in os.listdir(input_directory):
+    with perf_report.stage("merge.list"):
+        filenames = os.listdir(input_directory)
+    for filename in filenames:
         if filename.endswith('.ogg'):
             # 新的正则表达式：忽略分类词和数字之间的所有内容
             match = re.match(regex, filename, re.IGNORECASE)
 
             if match:
                 cn_flag, category, number = match.groups()
-                if category in categories:
+                if category in CATEGORIES:
                     file_path = os.path.join(input_directory, filename)
                     if cn_flag and 'cn' in cn_flag.lower():
                         categorized_files[category]['cn'].append((int(number), file_path))
@@ -42,16 +127,23 @@ def merge_ogg_files(character_name, input_directory, output_file):
         for file in unmatched_files:
             print(f"  - {file}")
     
+    return render_merge(categorized_files, output_file, gap_ms, cn_gap_ms, cache_dir, recognize)
+
+def render_merge(categorized_files, output_file, gap_ms=GAP_MS, cn_gap_ms=CN_GAP_MS, cache_dir=CLIP_CACHE_DIR,
+                 recognize=None, keep_audio=False):
+    # recognize(audio) 不为 None 时顺带识别合并结果；keep_audio 为 True 时成功返回合并后的 AudioSegment（供主进程识别）
     # 对每个分类中的文件按序号排序
-    for cat in categories:
+    for cat in CATEGORIES:
         categorized_files[cat]['cn'].sort(key=lambda x: x[0])
         categorized_files[cat]['non_cn'].sort(key=lambda x: x[0])
     
-    # 创建一个空的音频段用于存储最终合并后的音频
-    final_audio = AudioSegment.empty()
+    # 收集所有待合并的片段（各自已带上静音间隔），最后一次性拼接
+    segments = []
+    gap = AudioSegment.silent(duration=gap_ms)
+    cn_gap = AudioSegment.silent(duration=cn_gap_ms)
     
     # 按照分类词顺序合并所有音频
-    for cat in categories:
+    for cat in CATEGORIES:
         cn_files = categorized_files[cat]['cn']
         non_cn_files = categorized_files[cat]['non_cn']
         
@@ -75,8 +167,8 @@ def merge_ogg_files(character_name, input_directory, output_file):
             # 添加不带cn的文件（如果存在）
             if i < len(non_cn_files):
                 try:
-                    audio = AudioSegment.from_ogg(non_cn_files[i][1])
-                    final_audio += audio + AudioSegment.silent(duration=400)  # 添加0.6秒静音
+                    audio = load_clip(non_cn_files[i][1], cache_dir)
+                    segments.append(audio + gap)  # 添加静音间隔
                     print(f"  添加文件: {os.path.basename(non_cn_files[i][1])}")
                 except Exception as e:
                     print(f"  错误: 无法加载 {non_cn_files[i][1]}: {e}")
@@ -84,29 +176,107 @@ def merge_ogg_files(character_name, input_directory, output_file):
             # 添加带cn的文件（如果存在）
             if i < len(cn_files):
                 try:
-                    audio = AudioSegment.from_ogg(cn_files[i][1])
+                    audio = load_clip(cn_files[i][1], cache_dir)
                     audio = audio + 3  # 增加3dB音量
-                    final_audio += audio + AudioSegment.silent(duration=600)  # 添加0.6秒静音
+                    segments.append(audio + cn_gap)  # 添加静音间隔
                     print(f"  添加文件: {os.path.basename(cn_files[i][1])}")
                 except Exception as e:
                     print(f"  错误: 无法加载 {cn_files[i][1]}: {e}")
     
+    with perf_report.stage("merge.join"):
+        final_audio = join_segments(segments)
+    del segments
+    
     # 保存合并后的文件为MP3
     if len(final_audio) > 0:
         output_dir = os.path.dirname(output_file)
         # 确保输出目录存在
         os.makedirs(output_dir, exist_ok=True)
         
-        final_audio.export(output_file, format="mp3")
+        with perf_report.stage("merge.export"):
+            final_audio.export(output_file, format="mp3")
         print(f"\n合并完成! 输出文件: {output_file}")
         print(f"文件时长: {len(final_audio) / 1000:.2f} 秒")  # 修正为除以1000，显示正确的秒数
+        if recognize is not None:
+            caption_audio(final_audio, output_file, recognize)
+        return final_audio if keep_audio else True
     else:
         print("没有找到有效的音频文件进行合并!")
+        return False
+
+def group_by_character(input_directory):
+    # 只列一次目录，用同一个正则把所有文件按角色分组
+    characters = {}
+    unmatched_files = []
+    for filename in os.listdir(input_directory):
+        if not filename.endswith('.ogg'):
+            continue
+        match = BATCH_PATTERN.match(filename)
+        if not match or match.group('category') not in CATEGORIES:
+            unmatched_files.append(filename)
+            continue
+        name = match.group('name').lower()
+        categorized_files = characters.setdefault(
+            name, {cat: {'cn': [], 'non_cn': []} for cat in CATEGORIES}
+        )
+        kind = 'cn' if match.group('cn') else 'non_cn'
+        file_path = os.path.join(input_directory, filename)
+        categorized_files[match.group('category')][kind].append((int(match.group('number')), file_path))
+
+    if unmatched_files:
+        print("\n未匹配的文件:")
+        for file in unmatched_files:
+            print(f"  - {file}")
+    return characters
+
+def batch_merge(input_directory, output_directory, gap_ms=GAP_MS, cn_gap_ms=CN_GAP_MS,
+                cache_dir=CLIP_CACHE_DIR, workers=WORKERS, recognize=None):
+    # 批量模式：目录里每个角色各生成一个 {character}-cn.mp3，多个角色并行合并
+    # 模型只在主进程加载一份：子进程把合并好的音频传回来，主进程依次识别
+    start = time.perf_counter()
+    characters = group_by_character(input_directory)
+    print(f"共识别到 {len(characters)} 个角色: {', '.join(sorted(characters))}")
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {
+            name: pool.submit(
+                render_merge, categorized_files,
+                os.path.join(output_directory, f"{name}-cn.mp3"),
+                gap_ms, cn_gap_ms, cache_dir, None, recognize is not None
+            )
+            for name, categorized_files in sorted(characters.items())
+        }
+        for name, future in futures.items():
+            try:
+                result = future.result()
+                if recognize is not None and result is not False:
+                    caption_audio(result, os.path.join(output_directory, f"{name}-cn.mp3"), recognize)
+                results[name] = result is not False
+            except Exception as e:
+                print(f"错误: 角色 {name} 合并失败: {e}")
+                results[name] = False
+
+    done = sorted(name for name, ok in results.items() if ok)
+    failed = sorted(name for name, ok in results.items() if not ok)
+    print(f"\n批量合并完成: 成功 {len(done)} 个，失败/为空 {len(failed)} 个，用时 {time.perf_counter() - start:.2f} 秒")
+    if failed:
+        print(f"  未生成: {', '.join(failed)}")
+    return results
 
 if __name__ == "__main__":
-#如果是中英混合记得改时长400 600，纯中文就是500左右
+    # True 则合并目录中的所有角色，False 则只合并 character_name
+    BATCH_MODE = False
     character_name = 'pam'
     input_directory = r"G:\荒野乱斗\apk\v62\帕姆中文语音"
     output_file = fr"G:\荒野乱斗\apk\v62\{character_name}-cn1.mp3"
     
-    merge_ogg_files(character_name, input_directory, output_file)
\ No newline at end of file
+    recognize = None
+    if CAPTION_BACKEND:
+        from asr_backends import load_recognizer
+        recognize = load_recognizer(CAPTION_BACKEND)
+
+    if BATCH_MODE:
+        batch_merge(input_directory, os.path.dirname(output_file), recognize=recognize)
+    else:
+        merge_ogg_files(character_name, input_directory, output_file, recognize=recognize)
\ No newline at end of file
@@ -1,5 +1,16 @@
 from funasr import AutoModel
 import os
+import queue
+import subprocess
+import threading
+import time
+import numpy as np
+from transcribe_journal import TranscriptJournal, file_digest
+from transcript_cache import DEFAULT_CACHE_PATH, TranscriptCache
+from asr_shards import run_sharded
+from asr_server import transcribe_remote
+from audio_buffers import ffmpeg_binary, to_waveform
+import perf_report
 
 # 要装环境ffmpeg 还有numpy降级pip install "numpy<2" --force-reinstall
 # 第一次要下载2g左右模型文件。
@@ -8,62 +19,225 @@ AUDIO_DIR = r"D:\py中文转写\rm10AudioClip"
 OUTPUT_FILE = r"D:\py中文转写\rm10-1021.txt"
 BATCH_SIZE = 92  # 每处理92个文件写入分隔线
 
-def init_model():
+SAMPLE_RATE = 16000
+INFER_BATCH_SIZE = 16   # 每次送入模型的音频数（1 则逐个识别）
+BATCH_SIZE_S = 300      # funasr 动态批大小（按音频总秒数）
+PREFETCH_SIZE = 64      # 后台预解码的音频数上限
+
+MODEL = "paraformer-zh"
+VAD_MODEL = "fsmn-vad"
+PUNC_MODEL = "ct-punc"
+
+# 多进程分片（纯 CPU 机器用）：SHARDS 个进程各自加载模型，每个进程 THREADS_PER_SHARD 个推理线程
+SHARDS = 1
+THREADS_PER_SHARD = max(1, (os.cpu_count() or 1) // SHARDS)
+
+# 常驻识别服务地址（见 asr_server.py），例如 "http://127.0.0.1:8765"；设置后本地不加载模型，None 则本地识别
+SERVER_URL = None
+
+# 识别结果缓存（按音频内容哈希 + 模型组合），None 则不使用
+TRANSCRIPT_CACHE = DEFAULT_CACHE_PATH
+
+def model_id():
+    return f"funasr:{MODEL}+{VAD_MODEL}+{PUNC_MODEL}"
+
+def init_model(ncpu=None):
     print("加载模型中...")
+    options = {} if ncpu is None else {"ncpu": ncpu}  # funasr 用 ncpu 设置 torch 推理线程数
     model = AutoModel(
-        model="paraformer-zh",
-        vad_model="fsmn-vad",
-        punc_model="ct-punc",
-        device="cpu"
+        model=MODEL,
+        vad_model=VAD_MODEL,
+        punc_model=PUNC_MODEL,
+        device="cpu",
+        **options
     )
     print("模型加载完成")
     return model
 
-def recognize_audio(model, audio_path):
+def result_to_text(result):
+    text = ""
+    if isinstance(result, list):
+        for item in result:
+            if isinstance(item, dict) and "text" in item:
+                text += item["text"]
+    elif isinstance(result, dict):
+        text = result.get("text", "")
+    elif isinstance(result, str):
+        text = result
+    return text
+
+def recognize_audio(model, audio, sample_rate=None):
+    # audio 可以是文件路径，也可以是内存中的 AudioSegment、编码后的 bytes 或 numpy 数组（需给 sample_rate）
+    is_path = isinstance(audio, (str, os.PathLike))
+    label = audio if is_path else "内存音频"
     try:
-        result = model.generate(input=audio_path)
-        text = ""
-        if isinstance(result, list):
-            for item in result:
-                if isinstance(item, dict) and "text" in item:
-                    text += item["text"]
-        elif isinstance(result, str):
-            text = result
-        return text
+        options = {}
+        if not is_path:
+            audio, rate = to_waveform(audio, SAMPLE_RATE, sample_rate)
+            if rate != SAMPLE_RATE:
+                options["fs"] = rate  # 由 funasr 重采样到模型的采样率
+        with perf_report.stage("funasr.inference"):
+            result = model.generate(input=audio, **options)
+        return result_to_text(result)
     except Exception as e:
-        print(f"处理 {audio_path} 时出错: {e}")
+        print(f"处理 {label} 时出错: {e}")
         return None
 
+def decode_audio(audio_path):
+    # 用 ffmpeg 解码为 16k 单声道 float32，交给模型时不必再读文件
+    command = [
+        ffmpeg_binary(), "-nostdin", "-loglevel", "error", "-i", audio_path,
+        "-f", "f32le", "-ac", "1", "-ar", str(SAMPLE_RATE), "-",
+    ]
+    with perf_report.stage("funasr.decode"):
+        result = subprocess.run(command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.decode("utf-8", errors="replace").strip())
+    return np.frombuffer(result.stdout, dtype=np.float32).copy()
+
+def prefetch_audio(audio_files, out_queue):
+    # 后台线程：按顺序解码后续文件，队列满时阻塞，内存占用有上限
+    for filename in audio_files:
+        audio_path = os.path.join(AUDIO_DIR, filename)
+        try:
+            out_queue.put((filename, decode_audio(audio_path), None))
+        except Exception as e:
+            out_queue.put((filename, None, e))
+    out_queue.put(None)
+
+def iter_batches(in_queue):
+    batch = []
+    while True:
+        item = in_queue.get()
+        if item is None:
+            break
+        batch.append(item)
+        if len(batch) >= INFER_BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def recognize_batch(model, batch):
+    # 返回与 batch 顺序一致的文本列表；解码失败或识别失败的位置为 None
+    texts = [None] * len(batch)
+    ready = []
+    for i, (filename, waveform, error) in enumerate(batch):
+        if error is not None:
+            print(f"处理 {os.path.join(AUDIO_DIR, filename)} 时出错: {error}")
+        else:
+            ready.append(i)
+    if not ready:
+        return texts
+
+    # 时长相近的音频放在一起送入模型
+    ready.sort(key=lambda i: len(batch[i][1]))
+    try:
+        with perf_report.stage("funasr.inference"):
+            results = model.generate(input=[batch[i][1] for i in ready], batch_size_s=BATCH_SIZE_S)
+        if len(results) != len(ready):
+            raise RuntimeError(f"返回结果数 {len(results)} 与输入数 {len(ready)} 不一致")
+        for i, item in zip(ready, results):
+            texts[i] = result_to_text(item)
+    except Exception as e:
+        # 整批失败时退回逐个识别，确保单个坏文件不影响其他文件
+        print(f"批量识别出错，改为逐个识别: {e}")
+        for i in ready:
+            filename, waveform, _ = batch[i]
+            try:
+                with perf_report.stage("funasr.inference"):
+                    texts[i] = result_to_text(model.generate(input=waveform))
+            except Exception as e:
+                print(f"处理 {os.path.join(AUDIO_DIR, filename)} 时出错: {e}")
+    return texts
+
+def transcribe_pending(model, pending, emit):
+    # 每识别完一个文件调用 emit(filename, text)，返回推理耗时
+    # 后台预解码，模型推理当前批次时下一批已经在解码
+    audio_queue = queue.Queue(maxsize=PREFETCH_SIZE)
+    loader = threading.Thread(target=prefetch_audio, args=(pending, audio_queue), daemon=True)
+    loader.start()
+
+    busy_seconds = 0.0
+    for batch in iter_batches(audio_queue):
+        start = time.perf_counter()
+        texts = recognize_batch(model, batch)
+        busy_seconds += time.perf_counter() - start
+        for (filename, _, _), text in zip(batch, texts):
+            emit(filename, text)
+    return busy_seconds
+
+def shard_worker(pending, threads, emit):
+    # 分片子进程入口：限定推理线程数后各自加载模型
+    start = time.perf_counter()
+    model = init_model(ncpu=threads)
+    load_seconds = time.perf_counter() - start
+    busy_seconds = transcribe_pending(model, pending, emit)
+    return {"load_seconds": load_seconds, "busy_seconds": busy_seconds}
+
 def batch_recognize_to_single_file():
     if not os.path.exists(AUDIO_DIR):
         print("音频目录不存在")
         return
     
-    model = init_model()
     supported_formats = {".wav", ".mp3", ".flac", ".m4a", ".ogg"}
 
     # 获取所有音频文件并按数字排序
-    audio_files = [
-        f for f in os.listdir(AUDIO_DIR)
-        if os.path.splitext(f)[1].lower() in supported_formats
-    ]
-    audio_files.sort(key=lambda x: int(os.path.splitext(x)[0]))
-
-    with open(OUTPUT_FILE, "w", encoding="utf-8") as f_out:
-        for index, filename in enumerate(audio_files, 1):  # 从1开始计数
-            audio_path = os.path.join(AUDIO_DIR, filename)
-            text = recognize_audio(model, audio_path)
-            if text:
-                line = f"{text}\n"
-                f_out.write(line)
-                f_out.flush()
-                print(f"{filename}: {text}\n")
-            
-            # 每处理92个文件写入分隔线（最后一批不足92个也不额外添加）
-            if index % BATCH_SIZE == 0:
-                f_out.write("==============\n")
-                f_out.flush()
-                print(f"已处理{index}个文件，写入分隔线\n")
+    with perf_report.stage("funasr.scan"):
+        audio_files = [
+            f for f in os.listdir(AUDIO_DIR)
+            if os.path.splitext(f)[1].lower() in supported_formats
+        ]
+        audio_files.sort(key=lambda x: int(os.path.splitext(x)[0]))
+
+    cache = TranscriptCache(TRANSCRIPT_CACHE, model_id()) if TRANSCRIPT_CACHE else None
+    with TranscriptJournal(OUTPUT_FILE, model_id()) as journal:
+        digests = {}
+        try:
+            # 日志中已有且内容未变的文件直接跳过
+            digests.update((f, file_digest(os.path.join(AUDIO_DIR, f))) for f in audio_files)
+            pending = [f for f in audio_files if not journal.is_done(f, digests[f])]
+            if len(pending) < len(audio_files):
+                print(f"日志中已完成 {len(audio_files) - len(pending)} 个文件，本次识别剩余 {len(pending)} 个\n")
+
+            # 缓存命中的文件不加载音频也不跑模型
+            if cache:
+                remaining = []
+                for filename in pending:
+                    text = cache.get(digests[filename])
+                    if text is None:
+                        remaining.append(filename)
+                    else:
+                        journal.record(filename, digests[filename], text)
+                if cache.hits:
+                    print(f"缓存命中 {cache.hits} 个文件，需要识别 {len(remaining)} 个\n")
+                pending = remaining
+
+            def on_result(filename, text):
+                if text is not None:
+                    journal.record(filename, digests[filename], text)
+                    if cache:
+                        cache.put(digests[filename], text)
+                if text:
+                    print(f"{filename}: {text}\n")
+
+            # 只有确实需要识别时才加载模型
+            if pending and SERVER_URL:
+                paths = {os.path.abspath(os.path.join(AUDIO_DIR, f)): f for f in pending}
+                transcribe_remote(SERVER_URL, "funasr", list(paths), lambda path, text: on_result(paths[path], text))
+            elif pending and SHARDS > 1 and len(pending) > 1:
+                # 这里没有读音频头的依赖，按文件大小近似时长来均分
+                sizes = [os.path.getsize(os.path.join(AUDIO_DIR, f)) / 1024 / 1024 for f in pending]
+                run_sharded(shard_worker, pending, sizes, SHARDS, THREADS_PER_SHARD, on_result, unit="MB")
+            elif pending:
+                model = init_model()
+                transcribe_pending(model, pending, on_result)
+        finally:
+            if cache:
+                cache.close()
+            # 每92个文件写入分隔线（最后一批不足92个也不额外添加）
+            done = journal.write_output(OUTPUT_FILE, audio_files, digests, separator_every=BATCH_SIZE)
+            print(f"已从日志写入 {OUTPUT_FILE}（{done}/{len(audio_files)} 个文件）")
     
     print("全部处理完成。")
 
@@ -0,0 +1,201 @@
+import atexit
+import collections
+import cProfile
+import glob
+import json
+import multiprocessing
+import multiprocessing.util
+import os
+import pstats
+import sys
+import threading
+import time
+from contextlib import nullcontext
+
+# 性能统计：各脚本在关键步骤（列目录、ffmpeg 解码、重采样、模型推理、导出 MP3、写盘等）外面套一层
+#   with perf_report.stage("merge.export"):
+# 并用 perf_report.count(...) 记数量。默认关闭，stage() 直接返回一个空的上下文，几乎没有开销。
+#
+#   AUDIO_PERF=1                 开启计时，退出时写 JSON 报告
+#   AUDIO_PERF_REPORT=路径       报告路径（默认当前目录 perf-<脚本名>-<时间>.json）
+#   AUDIO_PERF_PROFILE=cprofile  同时用 cProfile 记录主线程，另存 .prof，报告中附耗时最多的函数
+#   AUDIO_PERF_PROFILE=sample    后台线程定时采样所有线程正在执行的位置（包括线程池里的 worker）
+#
+# 多线程下同一阶段的耗时会累加，总和可以超过运行时间。进程池里的子进程各自统计，退出时写临时文件，
+# 主进程退出时合并进报告。
+
+PROFILE = os.environ.get("AUDIO_PERF_PROFILE", "")
+ENABLED = os.environ.get("AUDIO_PERF", "") not in ("", "0") or bool(PROFILE)
+SAMPLE_INTERVAL = 0.005  # 采样间隔（秒）
+TOP_N = 30               # 报告中列出的函数/采样位置数
+WORKER_SUFFIX = ".worker-"
+
+_NULL = nullcontext()
+_lock = threading.Lock()
+_stages = {}                        # 名称 -> [次数, 总耗时, 最长一次]
+_counters = collections.Counter()
+_started = time.time()
+_start = time.perf_counter()
+_is_worker = False
+_written = False
+_profiler = None
+_sampler = None
+
+class _Timer:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self.name, time.perf_counter() - self.start)
+
+def stage(name):
+    return _Timer(name) if ENABLED else _NULL
+
+def record(name, seconds):
+    with _lock:
+        entry = _stages.get(name)
+        if entry is None:
+            _stages[name] = [1, seconds, seconds]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+
+def count(name, n=1):
+    if ENABLED:
+        with _lock:
+            _counters[name] += n
+
+class _Sampler(threading.Thread):
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.counts = collections.Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        me = threading.get_ident()
+        while not self.stopped.wait(SAMPLE_INTERVAL):
+            for ident, frame in sys._current_frames().items():
+                if ident != me:
+                    code = frame.f_code
+                    self.counts[f"{os.path.basename(code.co_filename)}:{frame.f_lineno}({code.co_name})"] += 1
+
+def report_path():
+    return os.environ["AUDIO_PERF_REPORT"]
+
+def _snapshot():
+    with _lock:
+        return {
+            "stages": {name: list(entry) for name, entry in _stages.items()},
+            "counters": dict(_counters),
+        }
+
+def _merge(into, other):
+    for name, (calls, total, longest) in other["stages"].items():
+        entry = into["stages"].setdefault(name, [0, 0.0, 0.0])
+        entry[0] += calls
+        entry[1] += total
+        entry[2] = max(entry[2], longest)
+    for name, value in other["counters"].items():
+        into["counters"][name] = into["counters"].get(name, 0) + value
+
+def _profile_summary():
+    stats = pstats.Stats(_profiler)
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:TOP_N]
+    return [
+        {"function": f"{os.path.basename(file)}:{line}({func})", "calls": nc,
+         "self_seconds": round(tt, 4), "cumulative_seconds": round(ct, 4)}
+        for (file, line, func), (_, nc, tt, ct, _) in rows
+    ]
+
+def write_report():
+    global _written
+    if _written:
+        return
+    _written = True
+    path = report_path()
+    snapshot = _snapshot()
+    if _is_worker:
+        with open(f"{path}{WORKER_SUFFIX}{os.getpid()}", "w", encoding="utf-8") as f:
+            json.dump(snapshot, f)
+        return
+
+    # 合并进程池子进程留下的统计
+    workers = 0
+    for worker_path in glob.glob(glob.escape(path) + WORKER_SUFFIX + "*"):
+        try:
+            with open(worker_path, "r", encoding="utf-8") as f:
+                _merge(snapshot, json.load(f))
+            workers += 1
+            os.remove(worker_path)
+        except (OSError, ValueError):
+            pass
+
+    wall = time.perf_counter() - _start
+    report = {
+        "script": os.path.basename(sys.argv[0]) if sys.argv else None,
+        "argv": sys.argv[1:],
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(_started)),
+        "wall_seconds": round(wall, 4),
+        "worker_processes": workers,
+        "stages": {
+            name: {"calls": calls, "total_seconds": round(total, 4), "max_seconds": round(longest, 4),
+                   "mean_ms": round(total / calls * 1000, 3)}
+            for name, (calls, total, longest) in sorted(snapshot["stages"].items(), key=lambda item: -item[1][1])
+        },
+        "counters": dict(sorted(snapshot["counters"].items())),
+    }
+    if _profiler is not None:
+        _profiler.disable()
+        profile_path = os.path.splitext(path)[0] + ".prof"
+        _profiler.dump_stats(profile_path)
+        report["profile"] = {"file": profile_path, "top_cumulative": _profile_summary()}
+    if _sampler is not None:
+        _sampler.stopped.set()
+        report["samples"] = {
+            "interval_seconds": SAMPLE_INTERVAL,
+            "top": dict(_sampler.counts.most_common(TOP_N)),
+        }
+
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n性能报告已写入 {path}（总用时 {wall:.2f} 秒）")
+    for name, entry in list(report["stages"].items())[:10]:
+        print(f"  {name}: {entry['calls']} 次，累计 {entry['total_seconds']:.2f} 秒，最长 {entry['max_seconds']:.2f} 秒")
+
+def _become_worker(_=None):
+    # 子进程只统计自己的部分，由 multiprocessing 在子进程退出时调用 write_report
+    global _is_worker, _written, _profiler, _sampler, _lock
+    _is_worker = True
+    _written = False
+    _profiler = None
+    _sampler = None
+    _lock = threading.Lock()  # fork 时锁可能正被其他线程持有
+    _stages.clear()
+    _counters.clear()
+    multiprocessing.util.Finalize(None, write_report, exitpriority=10)
+
+if ENABLED:
+    if multiprocessing.parent_process() is not None:
+        _become_worker()  # spawn 启动的子进程重新导入本模块
+    else:
+        # 写进环境变量，子进程沿用同一个报告路径
+        script = os.path.splitext(os.path.basename(sys.argv[0] if sys.argv and sys.argv[0] else "python"))[0]
+        os.environ.setdefault(
+            "AUDIO_PERF_REPORT", os.path.abspath(f"perf-{script}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+        )
+        atexit.register(write_report)
+        if PROFILE == "cprofile":
+            _profiler = cProfile.Profile()
+            _profiler.enable()
+        elif PROFILE == "sample":
+            _sampler = _Sampler()
+            _sampler.start()
+    # multiprocessing 子进程启动时会清空已注册的 Finalize，在那之后重新注册（fork 的子进程也在这里清掉继承来的统计）
+    multiprocessing.util.register_after_fork(_become_worker, _become_worker)
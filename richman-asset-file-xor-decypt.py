@@ -1,4 +1,11 @@
+import json
+import mmap
 import os
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from transcribe_journal import file_digest, new_hash
+import perf_report
 
 # 固定配置
 INPUT_DIR = r"D:\py中文转写\asset"  # 这里改成你的目录
@@ -6,31 +13,241 @@ INPUT_DIR = r"D:\py中文转写\asset"  # 这里改成你的目录
 KEY_BYTE = 0x01                    # 密钥
 GROUP_SIZE = 4                     # 每 4 个字节一组
 OVERWRITE = True                 # True 则直接覆盖原文件
-def decrypt_file(in_path, out_path):
-    with open(in_path, "rb") as f:
-        data = bytearray(f.read())
+CHUNK_SIZE = 16 * 1024 * 1024      # 每次处理 16MB，必须是 GROUP_SIZE 的整数倍
+
+# 并行配置
+WORKERS = os.cpu_count() or 1      # 进程数，设为 1 则逐个处理
+MAX_OPEN_FILES = WORKERS * 2       # 同时处理中的文件数上限
+MAX_IN_FLIGHT_BYTES = 1024 ** 3    # 同时处理中的文件总大小上限（1GB）
+
+# 增量清单：放在 INPUT_DIR 旁边，记录已解密文件，重复运行时跳过未变化的文件
+MANIFEST_SUFFIX = ".decrypt-manifest.json"
+MANIFEST_SAVE_INTERVAL = 10        # 运行中每隔多少秒落盘一次清单
+
+# 已知的明文文件头，用来判断文件是否已经解密过
+KNOWN_MAGICS = (
+    b"UnityFS", b"UnityWeb", b"UnityRaw", b"UnityArchive",
+    b"OggS", b"RIFF", b"FSB5", b"AKPK", b"BKHD", b"ID3",
+    b"\x89PNG", b"\xff\xd8\xff", b"PK\x03\x04",
+)
+HEADER_SIZE = 16
+
+# 字节查找表：translate 在 C 层完成 XOR，不用逐字节走 Python 循环
+XOR_TABLE = bytes(b ^ KEY_BYTE for b in range(256))
+
+
+def xor_groups(buf):
+    # buf 为可写缓冲区（memoryview / mmap 切片区域），起点必须与分组对齐
+    buf[0::GROUP_SIZE] = bytes(buf[0::GROUP_SIZE]).translate(XOR_TABLE)
+
 
-    for i in range(0, len(data), GROUP_SIZE):
-        data[i] ^= KEY_BYTE  # 每组第一个字节 XOR
+def sniff_header(path):
+    # 返回 "plain"（已是明文）、"encrypted"（解密后才是已知格式）或 None（无法判断）
+    with open(path, "rb") as f:
+        header = bytearray(f.read(HEADER_SIZE))
+    if header.startswith(KNOWN_MAGICS):
+        return "plain"
+    xor_groups(memoryview(header))
+    if header.startswith(KNOWN_MAGICS):
+        return "encrypted"
+    return None
 
-    with open(out_path, "wb") as f:
-        f.write(data)
+
+def decrypt_in_place(path):
+    # 覆盖模式：mmap 映射原文件，按块原地修改，内存占用与文件大小无关
+    h = new_hash()
+    size = os.path.getsize(path)
+    if size == 0:
+        return h.hexdigest()
+    with open(path, "r+b") as f, mmap.mmap(f.fileno(), 0) as mm:
+        for start in range(0, size, CHUNK_SIZE):
+            end = min(start + CHUNK_SIZE, size)
+            mm[start:end:GROUP_SIZE] = mm[start:end:GROUP_SIZE].translate(XOR_TABLE)
+            h.update(mm[start:end])
+        mm.flush()
+    return h.hexdigest()
+
+
+def decrypt_to_file(in_path, out_path):
+    # 另存模式：固定大小的块流式读写，块边界与 GROUP_SIZE 对齐
+    h = new_hash()
+    buf = bytearray(CHUNK_SIZE)
+    view = memoryview(buf)
+    with open(in_path, "rb") as f_in, open(out_path, "wb") as f_out:
+        while True:
+            n = f_in.readinto(buf)
+            if not n:
+                break
+            chunk = view[:n]
+            xor_groups(chunk)
+            h.update(chunk)
+            f_out.write(chunk)
+    return h.hexdigest()
+
+
+def decrypt_file(in_path, out_path):
+    if os.path.abspath(in_path) == os.path.abspath(out_path):
+        with perf_report.stage("decrypt.in_place"):
+            digest = decrypt_in_place(in_path)
+    else:
+        with perf_report.stage("decrypt.to_file"):
+            digest = decrypt_to_file(in_path, out_path)
+    perf_report.count("decrypt.files")
+    if perf_report.ENABLED:
+        perf_report.count("decrypt.bytes", os.path.getsize(out_path))  # 关闭统计时不多做一次 stat
     print(f"解密完成: {in_path} -> {out_path}")
+    return digest
 
-def process_directory(directory):
-    directory = os.path.abspath(directory)
+def manifest_path(directory):
+    return os.path.abspath(directory).rstrip("\\/") + MANIFEST_SUFFIX
+
+def load_manifest(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"清单读取失败，将全部重新检查: {path} -> {e}")
+        return {}
+
+def save_manifest(path, manifest):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def make_entry(in_path, out_path, digest):
+    src = os.stat(in_path)
+    out = src if out_path == in_path else os.stat(out_path)
+    return {
+        "size": src.st_size,
+        "mtime_ns": src.st_mtime_ns,
+        "out_size": out.st_size,
+        "out_mtime_ns": out.st_mtime_ns,
+        "hash": digest,
+    }
+
+def is_unchanged(entry, src, out_path):
+    if entry is None or entry["size"] != src.st_size or entry["mtime_ns"] != src.st_mtime_ns:
+        return False
+    try:
+        out = os.stat(out_path)
+    except OSError:
+        return False
+    return out.st_size == entry["out_size"] and out.st_mtime_ns == entry["out_mtime_ns"]
+
+def check_skip(rel, in_path, out_path, src, manifest):
+    # 返回 True 表示无需处理（必要时顺便更新清单）
+    entry = manifest.get(rel)
+    if is_unchanged(entry, src, out_path):
+        return True
+    if OVERWRITE and entry is not None and entry["out_size"] == src.st_size:
+        # 只是时间戳变了：内容哈希与上次解密结果一致则说明已解密
+        digest = file_digest(in_path)
+        if digest == entry["hash"]:
+            manifest[rel] = make_entry(in_path, out_path, digest)
+            return True
+    if sniff_header(in_path) == "plain":
+        # 文件头已是已知的明文格式，再 XOR 一次反而会重新加密
+        print(f"已是明文，跳过: {in_path}")
+        if OVERWRITE:
+            manifest[rel] = make_entry(in_path, out_path, file_digest(in_path))
+        return True
+    return False
+
+def collect_jobs(directory, manifest):
+    jobs = []
+    skipped = 0
     for root, _, files in os.walk(directory):
         for fname in files:
+            if not OVERWRITE and fname.endswith("_decrypted"):
+                continue
             in_path = os.path.join(root, fname)
             if OVERWRITE:
                 out_path = in_path
             else:
                 out_fname = fname + "_decrypted"
                 out_path = os.path.join(root, out_fname)
+            rel = os.path.relpath(in_path, directory)
             try:
-                decrypt_file(in_path, out_path)
-            except Exception as e:
+                src = os.stat(in_path)
+                if check_skip(rel, in_path, out_path, src, manifest):
+                    skipped += 1
+                    continue
+            except OSError as e:
                 print(f"处理失败: {in_path} -> {e}")
+                continue
+            jobs.append((src.st_size, in_path, out_path))
+    # 大文件优先，避免最后只剩一个大文件拖住整个进度
+    jobs.sort(key=lambda job: job[0], reverse=True)
+    return jobs, skipped
+
+def run_serial(jobs):
+    for job in jobs:
+        try:
+            yield job, decrypt_file(job[1], job[2]), None
+        except Exception as e:
+            yield job, None, e
+
+def run_parallel(jobs):
+    pending = {}
+    in_flight_bytes = 0
+    queue = deque(jobs)
+    with ProcessPoolExecutor(max_workers=WORKERS) as pool:
+        while queue or pending:
+            # 在打开文件数和在途字节数的上限内尽量多提交任务（至少保证一个在跑）
+            while queue and len(pending) < MAX_OPEN_FILES and (
+                not pending or in_flight_bytes + queue[0][0] <= MAX_IN_FLIGHT_BYTES
+            ):
+                job = queue.popleft()
+                future = pool.submit(decrypt_file, job[1], job[2])
+                pending[future] = job
+                in_flight_bytes += job[0]
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                job = pending.pop(future)
+                in_flight_bytes -= job[0]
+                try:
+                    yield job, future.result(), None
+                except Exception as e:
+                    yield job, None, e
+
+def process_directory(directory):
+    directory = os.path.abspath(directory)
+    start = time.perf_counter()
+    manifest_file = manifest_path(directory)
+    manifest = load_manifest(manifest_file)
+    with perf_report.stage("decrypt.scan"):
+        jobs, skipped = collect_jobs(directory, manifest)
+
+    runner = run_parallel if WORKERS > 1 and len(jobs) > 1 else run_serial
+    done_files = 0
+    done_bytes = 0
+    failed = 0
+    last_save = time.monotonic()
+    try:
+        for (size, in_path, out_path), digest, error in runner(jobs):
+            if error is None:
+                done_files += 1
+                done_bytes += size
+                rel = os.path.relpath(in_path, directory)
+                manifest[rel] = make_entry(in_path, out_path, digest)
+            else:
+                failed += 1
+                print(f"处理失败: {in_path} -> {error}")
+            if time.monotonic() - last_save >= MANIFEST_SAVE_INTERVAL:
+                save_manifest(manifest_file, manifest)
+                last_save = time.monotonic()
+    finally:
+        save_manifest(manifest_file, manifest)
+
+    elapsed = max(time.perf_counter() - start, 1e-9)
+    print(
+        f"共处理 {done_files} 个文件，跳过 {skipped} 个，失败 {failed} 个，用时 {elapsed:.2f} 秒，"
+        f"{done_files / elapsed:.1f} 文件/秒，{done_bytes / 1024 / 1024 / elapsed:.1f} MB/秒"
+    )
 
 if __name__ == "__main__":
     if not os.path.isdir(INPUT_DIR):
@@ -0,0 +1,217 @@
+import os
+import queue
+import re
+import threading
+import time
+import numpy as np
+from audio_transcode import transcode_bytes
+from transcribe_journal import TranscriptJournal, data_digest
+from transcript_cache import DEFAULT_CACHE_PATH, TranscriptCache
+from tool_loader import load_tool
+
+# 大富翁资源一条龙：解密 → 转 MP3（加前缀）→ 识别，三个阶段同时进行，每个文件一准备好就交给下一阶段。
+# 阶段之间用有界队列连接，内存占用有上限；解密结果和解码出的 PCM 都在内存里传递，不用反复读盘。
+# 注意：只有解密后本身就是音频文件（WAV/OGG/MP3/FLAC）的资源会往下走；
+# UnityFS 等资源包仍需先用外部工具导出 AudioClip，这里只负责解密（设置 DECRYPTED_DIR 时另存）。
+
+ASSET_DIR = r"D:\py中文转写\asset"
+DECRYPTED_DIR = None  # 解密结果另存目录（保留相对路径），None 则不落盘
+MP3_DIR = r"D:\py中文转写\rm10AudioClip-mp3"
+OUTPUT_FILE = r"D:\py中文转写\rm10-pipeline.txt"
+TRANSCRIBE = True     # False 则只解密和转换
+
+# 每个阶段的并发数
+DECRYPT_WORKERS = 2
+CONVERT_WORKERS = os.cpu_count() or 1
+QUEUE_SIZE = 32       # 阶段之间最多排队的文件数
+
+# 识别结果缓存，None 则不使用
+TRANSCRIPT_CACHE = DEFAULT_CACHE_PATH
+
+AUDIO_MAGICS = (b"OggS", b"ID3", b"fLaC")
+
+decrypt_tool = load_tool("richman-asset-file-xor-decypt.py")
+convert_tool = load_tool("wav2mp3-add-prefix.py")
+
+def is_audio(header):
+    return header.startswith(AUDIO_MAGICS) or (header[:4] == b"RIFF" and header[8:12] == b"WAVE")
+
+def natural_key(name):
+    # 与识别脚本按数字排序一致，文件名不是纯数字时按其中的数字段排序
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", name)]
+
+class Stage:
+    # 一个阶段 = workers 个线程，从 in_queue 取数据，func 返回 None 表示不再往下传
+    def __init__(self, name, func, in_queue, out_queue, workers):
+        self.name = name
+        self.func = func
+        self.in_queue = in_queue
+        self.out_queue = out_queue
+        self.count = 0
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+        self.threads = [threading.Thread(target=self._run, daemon=True) for _ in range(max(1, workers))]
+        self._running = len(self.threads)
+        for thread in self.threads:
+            thread.start()
+
+    def _run(self):
+        while True:
+            item = self.in_queue.get()
+            if item is None:
+                self.in_queue.put(None)  # 让同阶段的其他线程也能退出
+                break
+            start = time.perf_counter()
+            try:
+                result = self.func(item)
+            except Exception as e:
+                label = item if isinstance(item, str) else item[0]
+                print(f"[{self.name}] 处理失败: {label} -> {e}")
+                result = None
+            with self._lock:
+                self.count += 1
+                self.busy_seconds += time.perf_counter() - start
+            if result is not None:
+                self.out_queue.put(result)
+        with self._lock:
+            self._running -= 1
+            if self._running == 0:
+                self.out_queue.put(None)
+
+def decrypt_asset(rel):
+    # 先看文件头：解密后不是音频的资源不读入内存，需要时流式另存
+    in_path = os.path.join(ASSET_DIR, rel)
+    with open(in_path, "rb") as f:
+        header = bytearray(f.read(decrypt_tool.HEADER_SIZE))
+    plain = header.startswith(decrypt_tool.KNOWN_MAGICS)
+    if not plain:
+        decrypt_tool.xor_groups(memoryview(header))
+
+    out_path = os.path.join(DECRYPTED_DIR, rel) if DECRYPTED_DIR else None
+    if out_path:
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    if not is_audio(bytes(header)):
+        if out_path and not plain:
+            decrypt_tool.decrypt_to_file(in_path, out_path)
+        return None
+
+    with open(in_path, "rb") as f:
+        data = bytearray(f.read())
+    if not plain:
+        decrypt_tool.xor_groups(memoryview(data))
+    if out_path:
+        with open(out_path, "wb") as f:
+            f.write(data)
+    return rel, bytes(data)
+
+def run_pipeline():
+    if not os.path.isdir(ASSET_DIR):
+        print(f"目录不存在: {ASSET_DIR}")
+        return
+    os.makedirs(MP3_DIR, exist_ok=True)
+    asr = load_tool("funasr-based-audio2txt-richman.py") if TRANSCRIBE else None
+    journal = TranscriptJournal(OUTPUT_FILE, asr.model_id()) if TRANSCRIBE else None
+    digests = {}  # 文件名 -> 内容哈希
+
+    def convert_asset(item):
+        # 一次 ffmpeg：stdin 读入解密后的数据，同时写 MP3 和输出识别用的 16k PCM
+        rel, data = item
+        # 不同子目录下可能有同名资源，MP3 名和日志里的文件名都用相对路径（分隔符换成下划线）
+        name = rel.replace("\\", "/").replace("/", "_")
+        mp3_path = os.path.join(MP3_DIR, convert_tool.PREFIX + os.path.splitext(name)[0] + ".mp3")
+        digest = data_digest(data)
+        need_text = TRANSCRIBE and not journal.is_done(name, digest)
+        pcm = transcode_bytes(data, mp3_path, format="mp3", bitrate="192k",
+                              pcm_rate=asr.SAMPLE_RATE if need_text else None)
+        print(f"已转换：{rel} -> {os.path.basename(mp3_path)}")
+        waveform = np.frombuffer(pcm, dtype=np.float32).copy() if need_text else None
+        return name, digest, waveform
+
+    # 模型在单独的线程里加载，与解密、转换同时开始；识别线程第一次需要模型时才等它
+    loaded = {}
+
+    def load_model():
+        try:
+            asr.AUDIO_DIR = MP3_DIR
+            loaded["model"] = asr.init_model()
+        except Exception as e:
+            loaded["error"] = e
+    loader = threading.Thread(target=load_model, daemon=True) if TRANSCRIBE else None
+    if loader:
+        loader.start()
+
+    path_queue = queue.Queue(maxsize=QUEUE_SIZE)
+    audio_queue = queue.Queue(maxsize=QUEUE_SIZE)
+    decoded_queue = queue.Queue(maxsize=QUEUE_SIZE)
+    start = time.perf_counter()
+    decrypt_stage = Stage("解密", decrypt_asset, path_queue, audio_queue, DECRYPT_WORKERS)
+    convert_stage = Stage("转换", convert_asset, audio_queue, decoded_queue, CONVERT_WORKERS)
+
+    def feed():
+        for root, _, files in os.walk(ASSET_DIR):
+            for fname in sorted(files):
+                path_queue.put(os.path.relpath(os.path.join(root, fname), ASSET_DIR))
+        path_queue.put(None)
+    threading.Thread(target=feed, daemon=True).start()
+
+    # 识别阶段在主线程：模型和 sqlite 缓存都只在这个线程里用
+    model = None
+    recognized = 0
+    busy_seconds = 0.0
+    cache = TranscriptCache(TRANSCRIPT_CACHE, asr.model_id()) if TRANSCRIBE and TRANSCRIPT_CACHE else None
+    try:
+        batch = []
+        while True:
+            item = decoded_queue.get()
+            if item is not None:
+                name, digest, waveform = item
+                digests[name] = digest
+                if waveform is None:
+                    continue
+                text = cache.get(digest) if cache else None
+                if text is not None:
+                    journal.record(name, digest, text)
+                    continue
+                batch.append((name, digest, waveform))
+                if len(batch) < asr.INFER_BATCH_SIZE:
+                    continue
+            if batch:
+                if model is None:
+                    loader.join()
+                    if "error" in loaded:
+                        raise loaded["error"]
+                    model = loaded["model"]
+                t = time.perf_counter()
+                texts = asr.recognize_batch(model, [(name, waveform, None) for name, _, waveform in batch])
+                busy_seconds += time.perf_counter() - t
+                recognized += len(batch)
+                for (name, digest, _), text in zip(batch, texts):
+                    if text is not None:
+                        journal.record(name, digest, text)
+                        if cache:
+                            cache.put(digest, text)
+                    if text:
+                        print(f"{name}: {text}\n")
+                batch = []
+            if item is None:
+                break
+    finally:
+        if cache:
+            cache.close()
+        if journal:
+            names = sorted(digests, key=natural_key)
+            done = journal.write_output(OUTPUT_FILE, names, digests, separator_every=asr.BATCH_SIZE)
+            journal.close()
+            print(f"已从日志写入 {OUTPUT_FILE}（{done}/{len(names)} 个文件）")
+
+    wall = max(time.perf_counter() - start, 1e-9)
+    print(f"\n流水线用时 {wall:.2f} 秒：")
+    print(f"  解密: {decrypt_stage.count} 个资源，{len(decrypt_stage.threads)} 线程，累计 {decrypt_stage.busy_seconds:.2f} 秒")
+    print(f"  转换: {convert_stage.count} 个音频，{len(convert_stage.threads)} 线程，累计 {convert_stage.busy_seconds:.2f} 秒")
+    if TRANSCRIBE:
+        print(f"  识别: {recognized}/{len(digests)} 个音频需要跑模型，累计 {busy_seconds:.2f} 秒")
+    print("✅ 全部处理完成！")
+
+
+if __name__ == "__main__":
+    run_pipeline()
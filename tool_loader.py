@@ -0,0 +1,14 @@
+import importlib.util
+import os
+
+# 各工具脚本的文件名带连字符，不能直接 import，这里按文件名加载；配置和函数沿用脚本里的。
+# 本模块不导入任何工具，只在调用时加载用到的那一个。
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+def load_tool(filename, module_name=None):
+    path = os.path.join(ROOT, filename)
+    spec = importlib.util.spec_from_file_location(module_name or os.path.splitext(filename)[0].replace("-", "_"), path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
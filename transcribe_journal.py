@@ -0,0 +1,99 @@
+import hashlib
+import json
+import os
+import perf_report
+
+# 转写日志：每识别完一个文件就向 OUTPUT_FILE 旁的 JSONL 追加一行（文件名、内容哈希、模型、文本）。
+# 中途崩溃或 Ctrl-C 后重新运行，只需识别日志里还没有的文件，最终文本从日志按顺序重建。
+# 换了模型（或加速模式、精度）后旧记录不算完成，会重新识别；模型变化时追加一行 {"model": ...} 作为表头。
+
+JOURNAL_SUFFIX = ".journal.jsonl"
+SEPARATOR = "==============\n"
+
+# 内容哈希：日志、识别缓存、解密清单、增量构建和解码缓存都用它，各处的键必须一致
+def new_hash():
+    return hashlib.blake2b(digest_size=16)
+
+def data_digest(data):
+    h = new_hash()
+    h.update(data)
+    return h.hexdigest()
+
+def file_digest(path):
+    h = new_hash()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+class TranscriptJournal:
+    def __init__(self, output_file, model):
+        self.path = output_file + JOURNAL_SUFFIX
+        self.model = model
+        self.entries = {}
+        self.header_model = None
+        self._load()
+        self._file = open(self.path, "a", encoding="utf-8")
+        if self.header_model != model:
+            self._append({"model": model})
+            self.header_model = model
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # 崩溃时只写了一半的行
+                    if "file" in record:
+                        self.entries[record["file"]] = record
+                    elif "model" in record:
+                        self.header_model = record["model"]
+        except FileNotFoundError:
+            pass
+
+    def is_done(self, filename, digest):
+        record = self.entries.get(filename)
+        return record is not None and record["hash"] == digest and record.get("model") == self.model
+
+    def other_model(self, filename, digest):
+        # 内容未变，但日志里的结果是其他模型（或其他加速设置）识别的
+        record = self.entries.get(filename)
+        return record is not None and record["hash"] == digest and record.get("model") != self.model
+
+    def _append(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def record(self, filename, digest, text):
+        record = {"file": filename, "hash": digest, "model": self.model, "text": text}
+        with perf_report.stage("journal.record"):
+            self._append(record)
+        self.entries[filename] = record
+
+    def write_output(self, output_file, audio_files, digests, separator_every=None):
+        # 按 audio_files 的顺序重建输出文件，只写到日志中最后一个已完成的文件为止
+        # digests: 文件名 -> 当前内容哈希；内容已变、由其他模型识别或还没算哈希的文件不写出
+        done = [i for i, filename in enumerate(audio_files) if self.is_done(filename, digests.get(filename))]
+        last = done[-1] + 1 if done else 0
+        tmp_path = output_file + ".tmp"
+        with perf_report.stage("journal.write_output"), open(tmp_path, "w", encoding="utf-8") as f_out:
+            for index, filename in enumerate(audio_files[:last], 1):
+                record = self.entries.get(filename)
+                if self.is_done(filename, digests.get(filename)) and record["text"]:
+                    f_out.write(f"{record['text']}\n")
+                if separator_every and index % separator_every == 0:
+                    f_out.write(SEPARATOR)
+        os.replace(tmp_path, output_file)
+        return len(done)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
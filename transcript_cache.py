@@ -0,0 +1,69 @@
+import os
+import sqlite3
+import time
+
+# 识别结果缓存：按（音频内容哈希, 模型标识）保存文本，不同目录、不同版本里的相同音频只识别一次。
+# 命中时不需要加载音频也不需要跑模型；超过条数上限时淘汰最久未使用的记录。
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "audio2txt", "transcripts.sqlite3")
+DEFAULT_MAX_ENTRIES = 200000
+EVICT_EVERY = 100  # 每写入多少条检查一次上限
+
+class TranscriptCache:
+    def __init__(self, path, model_id, max_entries=DEFAULT_MAX_ENTRIES):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.model_id = model_id
+        self.max_entries = max_entries
+        self.hits = 0
+        self._puts = 0
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS transcripts ("
+            " digest TEXT NOT NULL, model TEXT NOT NULL, text TEXT NOT NULL, last_used REAL NOT NULL,"
+            " PRIMARY KEY (digest, model))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS transcripts_last_used ON transcripts (last_used)")
+        self._conn.commit()
+
+    def get(self, digest):
+        row = self._conn.execute(
+            "SELECT text FROM transcripts WHERE digest = ? AND model = ?", (digest, self.model_id)
+        ).fetchone()
+        if row is None:
+            return None
+        self._conn.execute(
+            "UPDATE transcripts SET last_used = ? WHERE digest = ? AND model = ?",
+            (time.time(), digest, self.model_id)
+        )
+        self.hits += 1
+        return row[0]
+
+    def put(self, digest, text):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO transcripts (digest, model, text, last_used) VALUES (?, ?, ?, ?)",
+            (digest, self.model_id, text, time.time())
+        )
+        self._puts += 1
+        if self._puts % EVICT_EVERY == 0:
+            self._evict()
+        self._conn.commit()
+
+    def _evict(self):
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM transcripts").fetchone()
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM transcripts WHERE rowid IN"
+                " (SELECT rowid FROM transcripts ORDER BY last_used LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+    def close(self):
+        self._evict()
+        self._conn.commit()
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -1,5 +1,8 @@
 import os
-from pydub import AudioSegment
+import time
+from concurrent.futures import ThreadPoolExecutor
+from audio_transcode import transcode
+import perf_report
 
 # 要处理的文件夹路径
 INPUT_DIR = r"D:\py中文转写\rm10AudioClip"
@@ -10,20 +13,78 @@ OUTPUT_DIR = INPUT_DIR
 # 前缀
 PREFIX = "Richman10_vo_"
 
+# 并行转换数（每个 worker 同时只跑一个 ffmpeg 编码），设为 1 则逐个转换
+WORKERS = os.cpu_count() or 1
+
+# 转换的同时识别（"whisper" 或 "funasr"）：直接识别源 WAV，不再解码刚生成的 MP3；None 则不识别
+TRANSCRIBE_BACKEND = None
+TRANSCRIPT_FILE = os.path.join(OUTPUT_DIR, "transcripts.txt")  # 每行 “MP3文件名: 文本”
+
+def convert_one(wav_path, mp3_path):
+    start = time.perf_counter()
+    with perf_report.stage("wav2mp3.ffmpeg"):
+        transcode(wav_path, mp3_path, format="mp3", bitrate="192k")
+    return time.perf_counter() - start
+
 def convert_wav_to_mp3():
     # 确保输出目录存在
     os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-    for file_name in os.listdir(INPUT_DIR):
+    # 先列出全部任务并排序，保证输出顺序固定
+    jobs = []
+    with perf_report.stage("wav2mp3.list"):
+        file_names = sorted(os.listdir(INPUT_DIR))
+    for file_name in file_names:
         if file_name.lower().endswith(".wav"):
             wav_path = os.path.join(INPUT_DIR, file_name)
             mp3_name = PREFIX + os.path.splitext(file_name)[0] + ".mp3"
             mp3_path = os.path.join(OUTPUT_DIR, mp3_name)
+            jobs.append((file_name, mp3_name, wav_path, mp3_path))
+
+    recognize = None
+    transcripts = []
+    if TRANSCRIBE_BACKEND:
+        from asr_backends import load_recognizer
+        recognize = load_recognizer(TRANSCRIBE_BACKEND)
+
+    start = time.perf_counter()
+    timings = []
+    total_bytes = 0
+    with ThreadPoolExecutor(max_workers=max(1, WORKERS)) as pool:
+        futures = [pool.submit(convert_one, wav_path, mp3_path) for _, _, wav_path, mp3_path in jobs]
+        # 按提交顺序取结果，控制台输出与逐个转换时一致
+        for (file_name, mp3_name, wav_path, _), future in zip(jobs, futures):
+            try:
+                elapsed = future.result()
+            except Exception as e:
+                print(f"转换失败：{file_name} -> {e}")
+                continue
+            print(f"已转换：{file_name} -> {mp3_name}（{elapsed:.2f} 秒）")
+            timings.append((elapsed, file_name))
+            total_bytes += os.path.getsize(wav_path)
+            perf_report.count("wav2mp3.files")
+            # 模型在主线程里识别，后面的文件照常在线程池中编码
+            if recognize is not None:
+                text = recognize(wav_path)
+                if text is not None:
+                    transcripts.append(f"{mp3_name}: {text}\n")
+
+    wall = max(time.perf_counter() - start, 1e-9)
+    if timings:
+        timings.sort(reverse=True)
+        cpu_total = sum(t for t, _ in timings)
+        print(f"\n单个文件耗时：平均 {cpu_total / len(timings):.2f} 秒，"
+              f"最短 {timings[-1][0]:.2f} 秒，最长 {timings[0][0]:.2f} 秒")
+        print("最慢的文件：")
+        for elapsed, file_name in timings[:5]:
+            print(f"  {file_name}: {elapsed:.2f} 秒")
+    print(f"共转换 {len(timings)}/{len(jobs)} 个文件，用时 {wall:.2f} 秒，"
+          f"{len(timings) / wall:.1f} 文件/秒，{total_bytes / 1024 / 1024 / wall:.1f} MB/秒（WAV）")
 
-            # 转换
-            print(f"正在转换：{file_name} -> {mp3_name}")
-            sound = AudioSegment.from_wav(wav_path)
-            sound.export(mp3_path, format="mp3", bitrate="192k")
+    if recognize is not None:
+        with open(TRANSCRIPT_FILE, "w", encoding="utf-8") as f:
+            f.writelines(transcripts)
+        print(f"识别结果已写入 {TRANSCRIPT_FILE}（{len(transcripts)}/{len(jobs)} 个文件）")
 
     print("✅ 全部转换完成！")
 
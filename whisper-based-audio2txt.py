@@ -1,8 +1,26 @@
+import io
 import os
+import queue
+import threading
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import torch
 import soundfile as sf
 import librosa
 from transformers import WhisperProcessor, WhisperForConditionalGeneration
+from transcribe_journal import TranscriptJournal, file_digest
+from transcript_cache import DEFAULT_CACHE_PATH, TranscriptCache
+from asr_shards import run_sharded
+from asr_server import transcribe_remote
+from audio_buffers import to_waveform
+import perf_report
+
+try:
+    import soxr  # 高性能重采样，没有安装时退回 librosa
+except ImportError:
+    soxr = None
 
 # ---------- 配置 ----------
 AUDIO_DIR = r"D:\py中文转写\提取\AudioClip\jp"
@@ -13,71 +31,418 @@ DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
 # MODEL_NAME = "TSukiLen/whisper-small-chinese-tw-minnan-hanzi"
 MODEL_NAME = "openai/whisper-small"
 
+# CPU 加速模式（只在没有 CUDA 时生效）：降低精度 + 贪心解码 + 静态 KV 缓存 + 启动时预热
+# 会带来少量精度损失，开启前先用 ACCURACY_CHECK 在样本上量一下
+FAST_CPU = False
+CPU_PRECISION = "int8"     # "int8" 线性层动态量化；"bf16" CPU 支持 bfloat16 时使用，否则退回 fp32；"fp32" 不变
+MAX_NEW_TOKENS = 128       # 每段最多生成的 token 数
+STATIC_CACHE = True        # 静态 KV 缓存，解码时不再反复分配显存/内存
+ACCURACY_CHECK = 0         # 大于 0 时只抽取 N 个文件，对比 fp32 与加速模式的识别结果、速度和模型大小，然后退出
+
+# 批量识别：按时长排序后每批送入模型的音频数（1 则逐个识别）
+WHISPER_BATCH_SIZE = 8
+
+# 音频预加载：后台线程池解码、转单声道、重采样并提取特征，推理只需等待模型
+LOADER_WORKERS = min(4, os.cpu_count() or 1)
+PREFETCH_BATCHES = 2       # 最多提前准备好的批次数
+WAVEFORM_CACHE_DIR = None  # 16k float32 波形缓存目录（.npy，按内容哈希命名），None 则不缓存
+
+# 长音频：Whisper 只看前 30 秒，更长的文件在静音处切成不超过 30 秒的片段，分别识别后按顺序拼接
+CHUNK_SECONDS = 30
+SILENCE_FRAME_MS = 30      # 计算能量的帧长
+
+# 多进程分片（纯 CPU 机器用）：SHARDS 个进程各自加载模型，每个进程 THREADS_PER_SHARD 个推理线程
+SHARDS = 1
+THREADS_PER_SHARD = max(1, (os.cpu_count() or 1) // SHARDS)
+
+# 常驻识别服务地址（见 asr_server.py），例如 "http://127.0.0.1:8765"；设置后本地不加载模型，None 则本地识别
+SERVER_URL = None
+
+# 识别结果缓存（按音频内容哈希 + 模型名），None 则不使用
+TRANSCRIPT_CACHE = DEFAULT_CACHE_PATH
+
+def fast_cpu():
+    return FAST_CPU and DEVICE == "cpu"
+
+def model_id():
+    # 加速模式的结果与 fp32 不完全一致，缓存要分开
+    if fast_cpu():
+        return f"whisper:{MODEL_NAME}:{CPU_PRECISION}:{MAX_NEW_TOKENS}"
+    return f"whisper:{MODEL_NAME}"
+
 # ---------- 初始化模型 ----------
-def init_model():
+def bf16_supported():
+    try:
+        return torch.ops.mkldnn._is_mkldnn_bf16_supported()
+    except Exception:
+        return False
+
+def optimize_for_cpu(model):
+    if CPU_PRECISION == "int8":
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    elif CPU_PRECISION == "bf16":
+        if bf16_supported():
+            model = model.to(torch.bfloat16)
+        else:
+            print("CPU 不支持 bfloat16，使用 fp32")
+    model.generation_config.num_beams = 1
+    model.generation_config.do_sample = False
+    model.generation_config.max_new_tokens = MAX_NEW_TOKENS
+    if STATIC_CACHE:
+        model.generation_config.cache_implementation = "static"
+    return model
+
+def warm_up(processor, model):
+    # 首次 generate 会初始化算子和缓存，放在加载时做掉，第一批不再额外变慢
+    silence = np.zeros(16000, dtype=np.float32)
+    features = processor.feature_extractor(silence, sampling_rate=16000, return_tensors="np").input_features[0]
+    generate_texts(processor, model, [features] * WHISPER_BATCH_SIZE)
+
+def init_model(fast=None):
+    fast = fast_cpu() if fast is None else fast
     print(f"加载模型 {MODEL_NAME} 中...")
     processor = WhisperProcessor.from_pretrained(MODEL_NAME)
     model = WhisperForConditionalGeneration.from_pretrained(MODEL_NAME).to(DEVICE)
+    model.eval()
+    if fast:
+        model = optimize_for_cpu(model)
+        warm_up(processor, model)
+        print(f"CPU 加速模式: {CPU_PRECISION}，max_new_tokens={MAX_NEW_TOKENS}，静态缓存={STATIC_CACHE}")
     print("模型加载完成")
     return processor, model
 
+def model_size_mb(model):
+    # 量化后的权重不在 parameters() 里，按序列化后的大小统计
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell() / 1024 / 1024
+
 # ---------- 音频加载 ----------
-def load_audio(audio_path, target_sample_rate=16000):
+def resample(waveform, orig_sr, target_sr):
+    if soxr is not None:
+        return soxr.resample(waveform, orig_sr, target_sr, quality="HQ")
+    return librosa.resample(waveform, orig_sr=orig_sr, target_sr=target_sr)
+
+def load_audio(audio_path, target_sample_rate=16000, digest=None):
+    # 传入 digest 且设置了 WAVEFORM_CACHE_DIR 时，重采样结果缓存到磁盘，重跑时直接读取
+    cache_path = None
+    if WAVEFORM_CACHE_DIR and digest:
+        cache_path = os.path.join(WAVEFORM_CACHE_DIR, f"{digest}_{target_sample_rate}.npy")
+        if os.path.exists(cache_path):
+            try:
+                with perf_report.stage("whisper.waveform_cache"):
+                    return torch.from_numpy(np.load(cache_path))
+            except Exception:
+                pass  # 缓存损坏则重新解码
     try:
-        waveform, sr = sf.read(audio_path)
+        with perf_report.stage("whisper.decode"):
+            waveform, sr = sf.read(audio_path, dtype="float32")
         # 如果是立体声，取平均变成单声道
         if len(waveform.shape) > 1:
             waveform = waveform.mean(axis=1)
         # 重采样
         if sr != target_sample_rate:
-            waveform = librosa.resample(waveform, orig_sr=sr, target_sr=target_sample_rate)
+            with perf_report.stage("whisper.resample"):
+                waveform = resample(waveform, sr, target_sample_rate)
+        waveform = np.ascontiguousarray(waveform, dtype=np.float32)
+        if cache_path:
+            os.makedirs(WAVEFORM_CACHE_DIR, exist_ok=True)
+            tmp_path = f"{cache_path}.{threading.get_ident()}.tmp.npy"
+            np.save(tmp_path, waveform)
+            os.replace(tmp_path, cache_path)
         # 转成 torch.Tensor
-        return torch.from_numpy(waveform).float()
+        return torch.from_numpy(waveform)
     except Exception as e:
         print(f"加载音频 {audio_path} 失败: {e}")
         return None
 
-# ---------- 音频识别 ----------
-def recognize_audio(processor, model, audio_path):
-    waveform = load_audio(audio_path)
+def split_on_silence(waveform, sample_rate=16000):
+    # 按帧计算能量，在每段后半部分能量最低的帧处切开，保证每段不超过 CHUNK_SECONDS
+    max_len = CHUNK_SECONDS * sample_rate
+    if len(waveform) <= max_len:
+        return [waveform]
+    frame = int(sample_rate * SILENCE_FRAME_MS / 1000)
+    n_frames = len(waveform) // frame
+    energy = np.square(waveform[:n_frames * frame].reshape(n_frames, frame)).mean(axis=1)
+    chunks = []
+    start = 0
+    while len(waveform) - start > max_len:
+        lo = (start + max_len // 2) // frame
+        hi = (start + max_len) // frame
+        cut = (lo + int(np.argmin(energy[lo:hi]))) * frame + frame // 2
+        chunks.append(waveform[start:cut])
+        start = cut
+    chunks.append(waveform[start:])
+    return chunks
+
+def load_features(feature_extractor, audio_path, digest=None):
+    # 在加载线程里完成切段和特征提取（log-mel），返回每段的特征列表；失败返回 None
+    waveform = load_audio(audio_path, digest=digest)
     if waveform is None:
         return None
+    return waveform_features(feature_extractor, waveform.numpy())
+
+def waveform_features(feature_extractor, waveform):
+    with perf_report.stage("whisper.features"):
+        return [
+            feature_extractor(chunk, sampling_rate=16000, return_tensors="np").input_features[0]
+            for chunk in split_on_silence(waveform)
+        ]
+
+def iter_loaded_buckets(feature_extractor, buckets):
+    # 生产者/消费者：线程池按批次提前准备特征，有界队列限制内存中的批次数
+    out_queue = queue.Queue(maxsize=PREFETCH_BATCHES)
+
+    def produce():
+        try:
+            with ThreadPoolExecutor(max_workers=LOADER_WORKERS) as pool:
+                for bucket in buckets:
+                    features = list(pool.map(
+                        lambda item: load_features(feature_extractor, os.path.join(AUDIO_DIR, item[0]), item[1]),
+                        bucket
+                    ))
+                    out_queue.put((bucket, features))
+        finally:
+            out_queue.put(None)
+
+    threading.Thread(target=produce, daemon=True).start()
+    while True:
+        item = out_queue.get()
+        if item is None:
+            break
+        yield item
+
+# ---------- 音频识别 ----------
+def recognize_audio(processor, model, audio, sample_rate=None):
+    # audio 可以是文件路径，也可以是内存中的 AudioSegment、编码后的 bytes 或 numpy 数组（需给 sample_rate）
+    # 长音频（如合并后的整段语音）按静音切段后分别识别再拼接
+    if isinstance(audio, (str, os.PathLike)):
+        label = audio
+        waveform = load_audio(audio)
+        if waveform is None:
+            return None
+        waveform = waveform.numpy()
+    else:
+        label = "内存音频"
+        try:
+            waveform, sr = to_waveform(audio, 16000, sample_rate)
+            if sr != 16000:
+                with perf_report.stage("whisper.resample"):
+                    waveform = resample(waveform, sr, 16000)
+        except Exception as e:
+            print(f"加载音频 {label} 失败: {e}")
+            return None
     try:
         # 台湾闽南语模型已经是专门训练的，不需要额外指定 language
-        input_features = processor(waveform, sampling_rate=16000, return_tensors="pt").input_features.to(DEVICE)
-        predicted_ids = model.generate(input_features)
-        transcription = processor.batch_decode(predicted_ids, skip_special_tokens=True)[0]
-        return transcription
+        features = waveform_features(processor.feature_extractor, waveform)
+        return recognize_batch(processor, model, [label], [features])[0]
     except Exception as e:
-        print(f"处理 {audio_path} 时出错: {e}")
+        print(f"处理 {label} 时出错: {e}")
         return None
 
+def audio_duration(audio_path):
+    # 只读文件头获取时长，用于排序分桶和多进程分片均衡；读不出时排在最前面，加载时再报错
+    try:
+        return sf.info(audio_path).duration
+    except Exception:
+        return 0.0
+
+def generate_texts(processor, model, features):
+    input_features = torch.from_numpy(np.stack(features)).to(DEVICE, dtype=model.dtype)
+    with perf_report.stage("whisper.inference"), torch.inference_mode():
+        predicted_ids = model.generate(input_features)
+    perf_report.count("whisper.segments", len(features))
+    return processor.batch_decode(predicted_ids, skip_special_tokens=True)
+
+def is_wide(char):
+    # 中日韩文字及全角标点
+    return unicodedata.east_asian_width(char) in ("W", "F")
+
+def join_chunks(parts):
+    # 长音频各段的文本拼回一句：中文段之间直接相连，英文等段之间补一个空格，避免切点处单词粘在一起
+    if len(parts) == 1:
+        return parts[0]
+    text = ""
+    for part in (p.strip() for p in parts):
+        if not part:
+            continue
+        if text and not (is_wide(text[-1]) or is_wide(part[0])):
+            text += " "
+        text += part
+    return text
+
+def recognize_batch(processor, model, audio_paths, features):
+    # 一批已提取好的特征一起 generate，返回与 audio_paths 顺序一致的文本，失败的位置为 None
+    # 长音频的各段与其他文件一起组批，识别后按段顺序拼回原文件
+    chunks = [(i, f) for i, clip in enumerate(features) if clip is not None for f in clip]
+    parts = [[] for _ in audio_paths]
+    failed = set()
+    for start in range(0, len(chunks), WHISPER_BATCH_SIZE):
+        batch = chunks[start:start + WHISPER_BATCH_SIZE]
+        try:
+            transcriptions = generate_texts(processor, model, [f for _, f in batch])
+        except Exception as e:
+            # 整批失败时退回逐个识别，确保单个坏文件不影响其他文件
+            print(f"批量识别出错，改为逐个识别: {e}")
+            transcriptions = []
+            for i, f in batch:
+                try:
+                    transcriptions.append(generate_texts(processor, model, [f])[0])
+                except Exception as e:
+                    print(f"处理 {audio_paths[i]} 时出错: {e}")
+                    transcriptions.append(None)
+        for (i, _), transcription in zip(batch, transcriptions):
+            if transcription is None:
+                failed.add(i)
+            else:
+                parts[i].append(transcription)
+    return [
+        join_chunks(parts[i]) if features[i] is not None and i not in failed else None
+        for i in range(len(audio_paths))
+    ]
+
+def transcribe_pending(processor, model, pending, emit):
+    # pending 为 [(filename, digest)]，每识别完一个文件调用 emit(filename, digest, text)，返回推理耗时
+    # 按时长排序分桶：特征虽然都补齐到 30 秒，但批量 generate 要等批内最长的文本解码完，
+    # 时长相近的放在一起，短音频不必陪着长音频多跑解码步数；结果由日志按文件名顺序写出
+    pending = sorted(pending, key=lambda item: audio_duration(os.path.join(AUDIO_DIR, item[0])))
+    buckets = [pending[i:i + WHISPER_BATCH_SIZE] for i in range(0, len(pending), WHISPER_BATCH_SIZE)]
+    busy_seconds = 0.0
+    for bucket, features in iter_loaded_buckets(processor.feature_extractor, buckets):
+        audio_paths = [os.path.join(AUDIO_DIR, filename) for filename, _ in bucket]
+        start = time.perf_counter()
+        texts = recognize_batch(processor, model, audio_paths, features)
+        busy_seconds += time.perf_counter() - start
+        for (filename, digest), text in zip(bucket, texts):
+            emit(filename, digest, text)
+    return busy_seconds
+
+def shard_worker(pending, threads, emit):
+    # 分片子进程入口：限定推理线程数后各自加载模型
+    torch.set_num_threads(threads)
+    start = time.perf_counter()
+    processor, model = init_model()
+    load_seconds = time.perf_counter() - start
+    busy_seconds = transcribe_pending(processor, model, pending, emit)
+    return {"load_seconds": load_seconds, "busy_seconds": busy_seconds}
+
+# ---------- 精度检查 ----------
+def char_error_rate(reference, hypothesis):
+    # 字符级编辑距离 / 参考文本长度
+    previous = list(range(len(hypothesis) + 1))
+    for i, r in enumerate(reference, 1):
+        current = [i]
+        for j, h in enumerate(hypothesis, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (r != h)))
+        previous = current
+    return previous[-1] / max(1, len(reference))
+
+def check_accuracy(sample_size):
+    # 在目录中均匀抽取 sample_size 个文件，分别用 fp32 和加速模式识别，输出 CER、耗时和模型大小
+    audio_files = sorted(
+        (f for f in os.listdir(AUDIO_DIR) if os.path.splitext(f)[1].lower() in {".wav", ".mp3", ".flac", ".m4a", ".ogg"}),
+        key=lambda x: int(os.path.splitext(x)[0])
+    )
+    step = max(1, len(audio_files) // sample_size)
+    sample = audio_files[::step][:sample_size]
+    audio_paths = [os.path.join(AUDIO_DIR, f) for f in sample]
+
+    # 结果按固定的键保存：CPU_PRECISION 也可能是 "fp32"，不能拿它当键
+    label = f"加速({CPU_PRECISION})"
+    results = {}
+    for key, fast in (("reference", False), ("fast", True)):
+        processor, model = init_model(fast=fast)
+        if not fast:
+            warm_up(processor, model)  # 加速模式在 init_model 里已预热，两边都不计首次 generate 的开销
+        features = [load_features(processor.feature_extractor, path) for path in audio_paths]
+        start = time.perf_counter()
+        texts = recognize_batch(processor, model, audio_paths, features)
+        results[key] = (texts, time.perf_counter() - start, model_size_mb(model))
+        del model
+
+    (ref_texts, ref_seconds, ref_size), (texts, seconds, size) = results["reference"], results["fast"]
+    errors = chars = 0
+    for filename, reference, hypothesis in zip(sample, ref_texts, texts):
+        if reference is None or hypothesis is None:
+            continue
+        cer = char_error_rate(reference, hypothesis)
+        errors += cer * max(1, len(reference))
+        chars += max(1, len(reference))
+        if cer > 0:
+            print(f"{filename}: CER {cer:.1%}\n  fp32: {reference}\n  {label}: {hypothesis}")
+    print(f"\n精度检查（{len(sample)} 个文件）:")
+    print(f"  CER: {errors / max(1, chars):.2%}")
+    print(f"  推理耗时: fp32 {ref_seconds:.2f} 秒，{label} {seconds:.2f} 秒（{ref_seconds / max(seconds, 1e-9):.2f} 倍）")
+    print(f"  模型大小: fp32 {ref_size:.0f} MB，{label} {size:.0f} MB")
+
 # ---------- 批量识别 ----------
 def batch_recognize_to_single_file():
     if not os.path.exists(AUDIO_DIR):
         print("音频目录不存在")
         return
 
-    processor, model = init_model()
     supported_formats = {".wav", ".mp3", ".flac", ".m4a", ".ogg"}
 
     # 获取所有音频文件并按数字排序
-    audio_files = [
-        f for f in os.listdir(AUDIO_DIR)
-        if os.path.splitext(f)[1].lower() in supported_formats
-    ]
-    audio_files.sort(key=lambda x: int(os.path.splitext(x)[0]))
-
-    with open(OUTPUT_FILE, "w", encoding="utf-8") as f_out:
-        for filename in audio_files:
-            audio_path = os.path.join(AUDIO_DIR, filename)
-            text = recognize_audio(processor, model, audio_path)
-            if text:
-                f_out.write(text + "\n")
-                f_out.flush()
-                print(f"{filename}: {text}\n")
+    with perf_report.stage("whisper.scan"):
+        audio_files = [
+            f for f in os.listdir(AUDIO_DIR)
+            if os.path.splitext(f)[1].lower() in supported_formats
+        ]
+        audio_files.sort(key=lambda x: int(os.path.splitext(x)[0]))
+
+    cache = TranscriptCache(TRANSCRIPT_CACHE, model_id()) if TRANSCRIPT_CACHE else None
+    with TranscriptJournal(OUTPUT_FILE, model_id()) as journal:
+        digests = {}
+        try:
+            pending = []
+            retranscribe = 0
+            for filename in audio_files:
+                # 日志中已有且内容未变的文件直接跳过
+                digest = digests[filename] = file_digest(os.path.join(AUDIO_DIR, filename))
+                if journal.is_done(filename, digest):
+                    continue
+                retranscribe += journal.other_model(filename, digest)
+                # 缓存命中的文件不加载音频也不跑模型
+                text = cache.get(digest) if cache else None
+                if text is not None:
+                    journal.record(filename, digest, text)
+                    continue
+                pending.append((filename, digest))
+            if retranscribe:
+                # 例如先用 fp32 跑过，再打开 FAST_CPU：加速模式的结果与 fp32 分开，不复用
+                print(f"{retranscribe} 个文件此前由其他模型识别，改用 {model_id()} 重新识别")
+            if cache and cache.hits:
+                print(f"缓存命中 {cache.hits} 个文件")
+
+            def on_result(filename, digest, text):
+                if text is not None:
+                    journal.record(filename, digest, text)
+                    if cache:
+                        cache.put(digest, text)
+                if text:
+                    print(f"{filename}: {text}\n")
+
+            # 只有确实需要识别时才加载模型
+            if pending and SERVER_URL:
+                paths = {os.path.abspath(os.path.join(AUDIO_DIR, f)): (f, d) for f, d in pending}
+                transcribe_remote(SERVER_URL, "whisper", list(paths), lambda path, text: on_result(*paths[path], text))
+            elif pending and SHARDS > 1 and len(pending) > 1:
+                durations = [audio_duration(os.path.join(AUDIO_DIR, filename)) for filename, _ in pending]
+                run_sharded(shard_worker, pending, durations, SHARDS, THREADS_PER_SHARD, on_result)
+            elif pending:
+                processor, model = init_model()
+                transcribe_pending(processor, model, pending, on_result)
+        finally:
+            if cache:
+                cache.close()
+            done = journal.write_output(OUTPUT_FILE, audio_files, digests)
+            print(f"已从日志写入 {OUTPUT_FILE}（{done}/{len(audio_files)} 个文件）")
     print("全部处理完成。")
 
 # ---------- 主程序 ----------
 if __name__ == "__main__":
-    batch_recognize_to_single_file()
+    if ACCURACY_CHECK:
+        check_accuracy(ACCURACY_CHECK)
+    else:
+        batch_recognize_to_single_file()